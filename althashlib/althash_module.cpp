@@ -0,0 +1,227 @@
+// Hand-written CPython extension exposing the Hasher as a hashlib-style
+// object, bypassing the SWIG proxy classes for lower per-call overhead.
+// Module functions take the same arguments as their SWIG counterparts,
+// so either backend can be used by althashlib.py.
+
+#include "gcrypt_hash_wrapper.hpp"
+#include <Python.h>
+
+typedef struct {
+  PyObject_HEAD
+  Hasher* hasher;
+} HashObject;
+
+static PyTypeObject HashType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+};
+
+static PyObject* wrap_hasher(Hasher* hasher)
+{
+  HashObject* self = PyObject_New(HashObject, &HashType);
+  if (!self) {
+    delete hasher;
+    return NULL;
+  }
+  self->hasher = hasher;
+  return (PyObject*) self;
+}
+
+static void HashObject_dealloc(HashObject* self)
+{
+  delete self->hasher;
+  PyObject_Del(self);
+}
+
+static PyObject* HashObject_update(HashObject* self, PyObject* data)
+{
+  self->hasher->update(data);
+  if (PyErr_Occurred()) {
+    return NULL;
+  }
+  Py_RETURN_NONE;
+}
+
+static PyObject* HashObject_digest(HashObject* self)
+{
+  return self->hasher->digest();
+}
+
+static PyObject* HashObject_hexdigest(HashObject* self)
+{
+  return self->hasher->hexdigest();
+}
+
+static PyObject* HashObject_copy(HashObject* self)
+{
+  Hasher* clone = self->hasher->copy();
+  if (!clone) {
+    return NULL;
+  }
+  return wrap_hasher(clone);
+}
+
+static PyObject* HashObject_get_digest_size(HashObject* self, void*)
+{
+  return PyInt_FromLong(self->hasher->digest_size());
+}
+
+static PyObject* HashObject_get_block_size(HashObject* self, void*)
+{
+  return PyInt_FromLong(self->hasher->block_size());
+}
+
+static PyObject* HashObject_get_name(HashObject* self, void*)
+{
+  return self->hasher->name();
+}
+
+static PyMethodDef HashObject_methods[] = {
+  {"update", (PyCFunction) HashObject_update, METH_O,
+   "Update this hash object's state with the provided buffer."},
+  {"digest", (PyCFunction) HashObject_digest, METH_NOARGS,
+   "Return the digest value as a string of binary data."},
+  {"hexdigest", (PyCFunction) HashObject_hexdigest, METH_NOARGS,
+   "Return the digest value as a string of hexadecimal digits."},
+  {"copy", (PyCFunction) HashObject_copy, METH_NOARGS,
+   "Return a copy of the hash object."},
+  {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef HashObject_getset[] = {
+  {(char*) "digest_size", (getter) HashObject_get_digest_size, NULL,
+   NULL, NULL},
+  {(char*) "block_size", (getter) HashObject_get_block_size, NULL,
+   NULL, NULL},
+  {(char*) "name", (getter) HashObject_get_name, NULL, NULL, NULL},
+  {NULL, NULL, NULL, NULL, NULL}
+};
+
+static PyObject* althash_new(PyObject*, PyObject* args)
+{
+  int hash_type;
+  PyObject* data = Py_None;
+  if (!PyArg_ParseTuple(args, "i|O:new", &hash_type, &data)) {
+    return NULL;
+  }
+  Hasher* hasher;
+  try {
+    hasher = new Hasher(hash_type);
+  } catch (gcry_error_t err) {
+    PyErr_SetString(PyExc_ValueError, gcry_strerror(err));
+    return NULL;
+  }
+  if (data != Py_None) {
+    hasher->update(data);
+    if (PyErr_Occurred()) {
+      delete hasher;
+      return NULL;
+    }
+  }
+  return wrap_hasher(hasher);
+}
+
+static PyObject* althash_algo_available(PyObject*, PyObject* args)
+{
+  int hash_type;
+  if (!PyArg_ParseTuple(args, "i:algo_available", &hash_type)) {
+    return NULL;
+  }
+  return PyBool_FromLong(algo_available(hash_type));
+}
+
+static PyObject* althash_hash_buffer(PyObject*, PyObject* args)
+{
+  int hash_type;
+  PyObject* data;
+  if (!PyArg_ParseTuple(args, "iO:hash_buffer", &hash_type, &data)) {
+    return NULL;
+  }
+  return hash_buffer(hash_type, data);
+}
+
+static PyObject* althash_hash_many(PyObject*, PyObject* args)
+{
+  int hash_type;
+  PyObject* buffers;
+  if (!PyArg_ParseTuple(args, "iO:hash_many", &hash_type, &buffers)) {
+    return NULL;
+  }
+  return hash_many(hash_type, buffers);
+}
+
+static PyObject* althash_hash_file(PyObject*, PyObject* args)
+{
+  int hash_type;
+  const char* path;
+  if (!PyArg_ParseTuple(args, "is:hash_file", &hash_type, &path)) {
+    return NULL;
+  }
+  return hash_file(hash_type, path);
+}
+
+static PyObject* althash_hash_files(PyObject*, PyObject* args)
+{
+  int hash_type;
+  PyObject* paths;
+  int workers = 0;
+  if (!PyArg_ParseTuple(args, "iO|i:hash_files",
+                        &hash_type, &paths, &workers)) {
+    return NULL;
+  }
+  return hash_files(hash_type, paths, workers);
+}
+
+static PyMethodDef althash_methods[] = {
+  {"new", althash_new, METH_VARARGS,
+   "new(hash_type[, data]) - create a new hash object."},
+  {"algo_available", althash_algo_available, METH_VARARGS,
+   "algo_available(hash_type) - whether libgcrypt implements the algorithm."},
+  {"hash_buffer", althash_hash_buffer, METH_VARARGS,
+   "hash_buffer(hash_type, data) - return the digest of data."},
+  {"hash_many", althash_hash_many, METH_VARARGS,
+   "hash_many(hash_type, buffers) - return a list of digests."},
+  {"hash_file", althash_hash_file, METH_VARARGS,
+   "hash_file(hash_type, path) - return the digest of a file."},
+  {"hash_files", althash_hash_files, METH_VARARGS,
+   "hash_files(hash_type, paths[, workers]) - return {path: digest}."},
+  {NULL, NULL, 0, NULL}
+};
+
+PyMODINIT_FUNC init_althash(void)
+{
+  HashType.tp_name = "_althash.HASH";
+  HashType.tp_basicsize = sizeof(HashObject);
+  HashType.tp_dealloc = (destructor) HashObject_dealloc;
+  HashType.tp_flags = Py_TPFLAGS_DEFAULT;
+  HashType.tp_doc = "A hash object, backed by libgcrypt";
+  HashType.tp_methods = HashObject_methods;
+  HashType.tp_getset = HashObject_getset;
+  if (PyType_Ready(&HashType) < 0) {
+    return;
+  }
+
+  PyObject* m = Py_InitModule3(
+      "_althash", althash_methods, "libgcrypt-backed hashing primitives");
+  if (!m) {
+    return;
+  }
+  Py_INCREF(&HashType);
+  PyModule_AddObject(m, "HASH", (PyObject*) &HashType);
+
+  PyModule_AddIntConstant(m, "SHA1", SHA1);
+  PyModule_AddIntConstant(m, "RMD160", RMD160);
+  PyModule_AddIntConstant(m, "MD5", MD5);
+  PyModule_AddIntConstant(m, "MD4", MD4);
+  PyModule_AddIntConstant(m, "SHA224", SHA224);
+  PyModule_AddIntConstant(m, "SHA256", SHA256);
+  PyModule_AddIntConstant(m, "SHA384", SHA384);
+  PyModule_AddIntConstant(m, "SHA512", SHA512);
+  PyModule_AddIntConstant(m, "WHIRLPOOL", WHIRLPOOL);
+  PyModule_AddIntConstant(m, "CRC32", CRC32);
+  PyModule_AddIntConstant(m, "SHA3_224", SHA3_224);
+  PyModule_AddIntConstant(m, "SHA3_256", SHA3_256);
+  PyModule_AddIntConstant(m, "SHA3_384", SHA3_384);
+  PyModule_AddIntConstant(m, "SHA3_512", SHA3_512);
+  PyModule_AddIntConstant(m, "BLAKE2B_512", BLAKE2B_512);
+  PyModule_AddIntConstant(m, "BLAKE2S_256", BLAKE2S_256);
+}
@@ -1,8 +1,20 @@
 # The schmall incomplete hashlib backed by libgcrypt
 
-import gcrypt_hash_wrapper as ghw
-
-algorithms_available = {
+import sys
+import types
+
+# The wrapper module (and with it, libgcrypt) is only loaded when the
+# first hash is requested, keeping it off the startup path of importers.
+# The hand-written extension (_althash) is used if it is available,
+# otherwise the SWIG wrapper is used, with hash objects built on top of it.
+ghw = None
+_native = False
+
+# Algorithms that all supported versions of libgcrypt implement. Those that
+# depend on the runtime version (see _algo_names) are added, and any that
+# turn out to be unavailable are removed, when the wrapper is loaded.
+# Exposed as algorithms_available, which loads the wrapper first.
+_algorithms_available = {
     'SHA256', 'sha256',
     'SHA224', 'sha224',
     'SHA384', 'sha384',
@@ -13,78 +25,212 @@ algorithms_available = {
     'RIPEMD160', 'ripemd160',
 }
 
-_algo_map = {
-    'SHA256': ghw.SHA256,
-    'sha256': ghw.SHA256,
-    'SHA224': ghw.SHA224,
-    'sha224': ghw.SHA224,
-    'SHA384': ghw.SHA384,
-    'sha384': ghw.SHA384,
-    'SHA512': ghw.SHA512,
-    'sha512': ghw.SHA512,
-    'SHA': ghw.SHA1,
-    'sha': ghw.SHA1,
-    'SHA1': ghw.SHA1,
-    'sha1': ghw.SHA1,
-    'md4': ghw.MD4,
-    'MD4': ghw.MD4,
-    'md5': ghw.MD5,
-    'MD5': ghw.MD5,
-    'whirlpool': ghw.WHIRLPOOL,
-    'RIPEMD160': ghw.RMD160,
-    'ripemd160': ghw.RMD160,
+# Names of the wrapper constants, resolved when the wrapper is loaded
+_algo_names = {
+    'SHA256': 'SHA256',
+    'sha256': 'SHA256',
+    'SHA224': 'SHA224',
+    'sha224': 'SHA224',
+    'SHA384': 'SHA384',
+    'sha384': 'SHA384',
+    'SHA512': 'SHA512',
+    'sha512': 'SHA512',
+    'SHA': 'SHA1',
+    'sha': 'SHA1',
+    'SHA1': 'SHA1',
+    'sha1': 'SHA1',
+    'md4': 'MD4',
+    'MD4': 'MD4',
+    'md5': 'MD5',
+    'MD5': 'MD5',
+    'whirlpool': 'WHIRLPOOL',
+    'RIPEMD160': 'RMD160',
+    'ripemd160': 'RMD160',
+    # Only listed if supported by the runtime version of libgcrypt
+    'sha3_224': 'SHA3_224',
+    'sha3_256': 'SHA3_256',
+    'sha3_384': 'SHA3_384',
+    'sha3_512': 'SHA3_512',
+    'blake2b': 'BLAKE2B_512',
+    'blake2s': 'BLAKE2S_256',
+    # Not cryptographic, but fast; useful for change detection
+    'crc32': 'CRC32',
 }
 
+# Algorithm name -> wrapper constant value
+_algo_map = {}
+
+
+def _load_wrapper():
+    global ghw, _native
+    try:
+        import _althash as wrapper
+        _native = True
+    except ImportError:
+        import gcrypt_hash_wrapper as wrapper
+    for name, const in _algo_names.items():
+        algo = getattr(wrapper, const)
+        if wrapper.algo_available(algo):
+            _algo_map[name] = algo
+    _algorithms_available.intersection_update(_algo_map)
+    _algorithms_available.update(_algo_map)
+    ghw = wrapper
+
+
+def _algo(name):
+    if ghw is None:
+        _load_wrapper()
+    try:
+        return _algo_map[name]
+    except KeyError:
+        raise ValueError('unsupported hash type ' + name)
+
+
+class _Module (types.ModuleType):
+    """This module, with the attributes that need the wrapper loaded"""
+
+    @property
+    def algorithms_available(self):
+        if ghw is None:
+            _load_wrapper()
+        return _algorithms_available
+
+
+class _ModuleProxy (_Module):
+    """Stand-in for this module, where its class cannot be changed"""
+
+    def __init__(self, module):
+        _Module.__init__(self, module.__name__, module.__doc__)
+        # Also keeps the module, and with it the globals, alive
+        self._module = module
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
 
 class GenericHash (object):
 
     def __init__(self, name, data=None):
-        algo = _algo_map.get(name, ghw.SHA1)
+        algo = _algo(name)
         self.hasher = ghw.Hasher(algo)
-        self.block_size = None  # Assumption: not necessary for this use case
-        if data:
+        if data is not None:
             self.update(data)
 
     def update(self, data):
         return self.hasher.update(data)
 
     def copy(self):
-        raise NotImplementedError
+        clone = GenericHash.__new__(GenericHash)
+        clone.hasher = self.hasher.copy()
+        return clone
 
     @property
     def digest_size(self):
         return self.hasher.digest_size()
 
+    @property
+    def block_size(self):
+        return self.hasher.block_size()
+
+    @property
+    def name(self):
+        return self.hasher.name()
+
     def digest(self):
         return self.hasher.digest()
 
     def hexdigest(self):
-        return self.hasher.digest().encode('hex')
+        return self.hasher.hexdigest()
 
 
 def new(name, data=None):
+    algo = _algo(name)
+    if _native:
+        return ghw.new(algo, data)
     return GenericHash(name, data)
 
 
+def hash_buffer(name, data):
+    """Return the digest of data, without creating a hash object"""
+    algo = _algo(name)
+    return ghw.hash_buffer(algo, data)
+
+
+def hash_many(name, buffers):
+    """Return a list of the digests of each buffer in the iterable"""
+    algo = _algo(name)
+    return ghw.hash_many(algo, buffers)
+
+
+def hash_file(path, name):
+    """Return the digest of the contents of the file at path"""
+    algo = _algo(name)
+    return ghw.hash_file(algo, path)
+
+
+def hash_files(paths, name, workers=0):
+    """Return a {path: digest} dict for the given file paths
+
+    The files are hashed in parallel by a pool of native threads;
+    by default one thread is used per CPU core.
+    """
+    algo = _algo(name)
+    return ghw.hash_files(algo, list(paths), workers)
+
+
 def md5(data=None):
-    return GenericHash('md5', data)
+    return new('md5', data)
 
 
 def sha1(data=None):
-    return GenericHash('sha1', data)
+    return new('sha1', data)
 
 
 def sha224(data=None):
-    return GenericHash('sha224', data)
+    return new('sha224', data)
 
 
 def sha256(data=None):
-    return GenericHash('sha256', data)
+    return new('sha256', data)
 
 
 def sha384(data=None):
-    return GenericHash('sha384', data)
+    return new('sha384', data)
 
 
 def sha512(data=None):
-    return GenericHash('sha512', data)
+    return new('sha512', data)
+
+
+def sha3_224(data=None):
+    return new('sha3_224', data)
+
+
+def sha3_256(data=None):
+    return new('sha3_256', data)
+
+
+def sha3_384(data=None):
+    return new('sha3_384', data)
+
+
+def sha3_512(data=None):
+    return new('sha3_512', data)
+
+
+def blake2b(data=None):
+    return new('blake2b', data)
+
+
+def blake2s(data=None):
+    return new('blake2s', data)
+
+
+def crc32(data=None):
+    return new('crc32', data)
+
+
+try:
+    sys.modules[__name__].__class__ = _Module
+except TypeError:  # Python 2
+    sys.modules[__name__] = _ModuleProxy(sys.modules[__name__])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for althashlib
+
+Run from the althashlib directory after building the extension in place:
+
+    python setup.py build_ext --inplace
+    python benchmark.py
+
+To compare the two extension backends, build both of them and pick one
+with the --backend option:
+
+    ALTHASHLIB_BACKEND=both python setup.py build_ext --inplace
+    python benchmark.py --backend capi
+    python benchmark.py --backend swig
+
+Each benchmark reports the number of inputs hashed, or digests read,
+per second (best of 3 runs).
+"""
+
+from __future__ import print_function
+
+import subprocess
+import sys
+import timeit
+from argparse import ArgumentParser
+
+SETUP = """
+import althashlib
+h = althashlib.sha256('prefix')
+small = ['tile-key-%d' % i for i in range(1000)]
+"""
+
+# (name, statement, number of calls, inputs per call)
+BENCHMARKS = [
+    ("small update", "h.update('x')", 500000, 1),
+    ("digest", "h.digest()", 200000, 1),
+    ("hexdigest", "h.hexdigest()", 200000, 1),
+    ("update + digest", "h.update('chunk'); h.digest()", 200000, 1),
+    ("update + hexdigest", "h.update('chunk'); h.hexdigest()", 200000, 1),
+    ("construct: sha256()", "althashlib.sha256()", 200000, 1),
+    ("construct: new('md5')", "althashlib.new('md5')", 200000, 1),
+    ("small: sha256(s).digest", "althashlib.sha256('tile-key').digest()",
+     100000, 1),
+    ("small: hash_buffer", "althashlib.hash_buffer('sha256', 'tile-key')",
+     100000, 1),
+    ("small: hash_many", "althashlib.hash_many('sha256', small)",
+     200, 1000),
+]
+
+
+def inputs_per_second(stmt, number, inputs=1, setup=SETUP):
+    best = min(timeit.repeat(stmt, setup, repeat=3, number=number))
+    return number * inputs / best
+
+
+# Code hiding the backend that should not be used
+BACKEND_SETUP = {
+    "auto": "",
+    "capi": "import sys; sys.modules['gcrypt_hash_wrapper'] = None",
+    "swig": "import sys; sys.modules['_althash'] = None",
+}
+
+# Measures the import in a fresh interpreter, so that nothing is cached
+IMPORT_STMT = """
+import time
+t = time.time()
+import althashlib
+print(time.time() - t)
+"""
+
+
+def import_time(backend_setup, runs=20):
+    """Best time (seconds) for importing althashlib in a new process"""
+    cmd = [sys.executable, "-c", backend_setup + IMPORT_STMT]
+    return min(float(subprocess.check_output(cmd)) for _ in range(runs))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-s", "--scale", type=float, default=1.0,
+        help="Scale the number of calls of every benchmark by this factor"
+    )
+    parser.add_argument(
+        "-b", "--backend", choices=sorted(BACKEND_SETUP), default="auto",
+        help="Extension backend to benchmark (default: the one althashlib "
+             "picks by itself)"
+    )
+    args = parser.parse_args()
+    backend_setup = BACKEND_SETUP[args.backend]
+    exec(backend_setup, {})
+    import althashlib
+    althashlib.new('sha256')
+    print("Backend: " + althashlib.ghw.__name__)
+    for name, stmt, number, inputs in BENCHMARKS:
+        number = max(1, int(number * args.scale))
+        rate = inputs_per_second(stmt, number, inputs)
+        print("{name:<28}{rate:>14,.0f} /s".format(name=name, rate=rate))
+    print("{name:<28}{t:>14.3f} ms".format(
+        name="import althashlib", t=import_time(backend_setup) * 1000
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+"""
+Conformance tests and benchmarks for althashlib
+
+For every name in althashlib.algorithms_available, the digests are
+checked against known test vectors, and against the stock hashlib
+implementations (_hashlib, _sha, _md5 etc.) when they are available,
+for inputs from 0 bytes up to a maximum size (256 MiB by default),
+hashed both in one go and in chunks. The one-shot, batch and file
+hashing functions are checked as well.
+
+Afterwards, throughput (MB/s) for large inputs and call rates for small
+inputs are reported, next to those of the stock implementations.
+
+Run from the althashlib directory after building the extension in place:
+
+    python setup.py build_ext --inplace
+    python conformance.py
+
+The exit status is non-zero if any digest does not match.
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+import althashlib
+
+MB = 1 << 20
+
+MILLION_A = 'a' * 1000000
+
+# Test vectors for the empty string, 'abc' and one million 'a's.
+# Algorithms not implemented by the runtime libgcrypt are not checked.
+KNOWN_VECTORS = {
+    'md4': (
+        '31d6cfe0d16ae931b73c59d7e0c089c0',
+        'a448017aaf21d8525fc10ae87aa6729d',
+        'bbce80cc6bb65e5c6745e30d4eeca9a4',
+    ),
+    'md5': (
+        'd41d8cd98f00b204e9800998ecf8427e',
+        '900150983cd24fb0d6963f7d28e17f72',
+        '7707d6ae4e027c70eea2a935c2296f21',
+    ),
+    'sha1': (
+        'da39a3ee5e6b4b0d3255bfef95601890afd80709',
+        'a9993e364706816aba3e25717850c26c9cd0d89d',
+        '34aa973cd4c4daa4f61eeb2bdbad27316534016f',
+    ),
+    'sha224': (
+        'd14a028c2a3a2bc9476102bb288234c415a2b01f828ea62ac5b3e42f',
+        '23097d223405d8228642a477bda255b32aadbce4bda0b3f7e36c9da7',
+        '20794655980c91d8bbb4c1ea97618a4bf03f42581948b2ee4ee7ad67',
+    ),
+    'sha256': (
+        'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+        'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad',
+        'cdc76e5c9914fb9281a1c7e284d73e67f1809a48a497200e046d39ccc7112cd0',
+    ),
+    'sha384': (
+        '38b060a751ac96384cd9327eb1b1e36a21fdb71114be0743'
+        '4c0cc7bf63f6e1da274edebfe76f65fbd51ad2f14898b95b',
+        'cb00753f45a35e8bb5a03d699ac65007272c32ab0eded163'
+        '1a8b605a43ff5bed8086072ba1e7cc2358baeca134c825a7',
+        '9d0e1809716474cb086e834e310a4a1ced149e9c00f24852'
+        '7972cec5704c2a5b07b8b3dc38ecc4ebae97ddd87f3d8985',
+    ),
+    'sha512': (
+        'cf83e1357eefb8bdf1542850d66d8007d620e4050b5715dc83f4a921d36ce9ce'
+        '47d0d13c5d85f2b0ff8318d2877eec2f63b931bd47417a81a538327af927da3e',
+        'ddaf35a193617abacc417349ae20413112e6fa4e89a97ea20a9eeee64b55d39a'
+        '2192992a274fc1a836ba3c23a3feebbd454d4423643ce80e2a9ac94fa54ca49f',
+        'e718483d0ce769644e2e42c7bc15b4638e1f98b13b2044285632a803afa973eb'
+        'de0ff244877ea60a4cb0432ce577c31beb009c5c2c49aa2e4eadb217ad8cc09b',
+    ),
+    'ripemd160': (
+        '9c1185a5c5e9fc54612808977ee8f548b2258d31',
+        '8eb208f7e05d987a9b044a8e98c6b087f15a0bfc',
+        '52783243c1697bdbe16d37f97f68f08325dc1528',
+    ),
+    'whirlpool': (
+        '19fa61d75522a4669b44e39c1d2e1726c530232130d407f89afee0964997f7a7'
+        '3e83be698b288febcf88e3e03c4f0757ea8964e59b63d93708b138cc42a66eb3',
+        '4e2448a4c6f486bb16b6562c73b4020bf3043e3a731bce721ae1b303d97e6d4c'
+        '7181eebdb6c57e277d0e34957114cbd6c797fc9d95d8b582d225292076d4eef5',
+        '0c99005beb57eff50a7cf005560ddf5d29057fd86b20bfd62deca0f1ccea4af5'
+        '1fc15490eddc47af32bb2b66c34ff9ad8c6008ad677f77126953b226e4ed8b01',
+    ),
+    'sha3_224': (
+        '6b4e03423667dbb73b6e15454f0eb1abd4597f9a1b078e3f5b5a6bc7',
+        'e642824c3f8cf24ad09234ee7d3c766fc9a3a5168d0c94ad73b46fdf',
+        'd69335b93325192e516a912e6d19a15cb51c6ed5c15243e7a7fd653c',
+    ),
+    'sha3_256': (
+        'a7ffc6f8bf1ed76651c14756a061d662f580ff4de43b49fa82d80a4b80f8434a',
+        '3a985da74fe225b2045c172d6bd390bd855f086e3e9d525b46bfe24511431532',
+        '5c8875ae474a3634ba4fd55ec85bffd661f32aca75c6d699d0cdcb6c115891c1',
+    ),
+    'sha3_384': (
+        '0c63a75b845e4f7d01107d852e4c2485c51a50aaaa94fc61'
+        '995e71bbee983a2ac3713831264adb47fb6bd1e058d5f004',
+        'ec01498288516fc926459f58e2c6ad8df9b473cb0fc08c25'
+        '96da7cf0e49be4b298d88cea927ac7f539f1edf228376d25',
+        'eee9e24d78c1855337983451df97c8ad9eedf256c6334f8e'
+        '948d252d5e0e76847aa0774ddb90a842190d2c558b4b8340',
+    ),
+    'sha3_512': (
+        'a69f73cca23a9ac5c8b567dc185a756e97c982164fe25859e0d1dcc1475c80a6'
+        '15b2123af1f5f94c11e3e9402c3ac558f500199d95b6d3e301758586281dcd26',
+        'b751850b1a57168a5693cd924b6b096e08f621827444f70d884f5d0240d2712e'
+        '10e116e9192af3c91a7ec57647e3934057340b4cf408d5a56592f8274eec53f0',
+        '3c3a876da14034ab60627c077bb98f7e120a2a5370212dffb3385a18d4f38859'
+        'ed311d0a9d5141ce9cc5c66ee689b266a8aa18ace8282a0e0db596c90b0a7b87',
+    ),
+    'blake2b': (
+        '786a02f742015903c6c6fd852552d272912f4740e15847618a86e217f71f5419'
+        'd25e1031afee585313896444934eb04b903a685b1448b755d56f701afe9be2ce',
+        'ba80a53f981c4d0d6a2797b69f12f6e94c212f14685ac4b74b12bb6fdbffa2d1'
+        '7d87c5392aab792dc252d5de4533cc9518d38aa8dbf1925ab92386edd4009923',
+        '98fb3efb7206fd19ebf69b6f312cf7b64e3b94dbe1a17107913975a793f177e1'
+        'd077609d7fba363cbba00d05f7aa4e4fa8715d6428104c0a75643b0ff3fd3eaf',
+    ),
+    'blake2s': (
+        '69217a3079908094e11121d042354a7c1f55b6482ca1a51e1b250dfd1ed0eef9',
+        '508c5e8c327c14e2e1a72ba34eeb452f37458b209ed63a294d999b4c86675982',
+        'bec0c0e6cde5b67acb73b81f79a67a4079ae1c60dac9d2661af18e9f8b50dfa5',
+    ),
+    'crc32': (
+        '00000000',
+        '352441c2',
+        'dc25bfbc',
+    ),
+}
+
+# Sizes around the block boundaries, and around the GIL release threshold
+SMALL_SIZES = [0, 1, 55, 56, 63, 64, 65, 111, 112, 127, 128, 129,
+               1000, 2047, 2048, 2049, 65536, MB + 1]
+LARGE_SIZES = [16 * MB, 64 * MB, 256 * MB]
+
+# Chunk sizes used when splitting inputs into several updates
+CHUNK_SIZES = [1, 7, 64, 4099, MB + 3]
+
+
+def stock_constructor(name):
+    """Return a constructor for the stock implementation, or None"""
+    try:
+        import _hashlib
+        _hashlib.new(name)
+        return lambda data='': _hashlib.new(name, data)
+    except (ImportError, ValueError):
+        pass
+    builtins = {
+        'md5': ('_md5', 'new'),
+        'sha1': ('_sha', 'new'),
+        'sha224': ('_sha256', 'sha224'),
+        'sha256': ('_sha256', 'sha256'),
+        'sha384': ('_sha512', 'sha384'),
+        'sha512': ('_sha512', 'sha512'),
+    }
+    if name in builtins:
+        module, func = builtins[name]
+        try:
+            return getattr(__import__(module), func)
+        except ImportError:
+            pass
+    return None
+
+
+def test_data(size, seed=0):
+    """Deterministic pseudo-random data of the given size"""
+    rng = random.Random(seed)
+    block = ''.join(chr(rng.randint(0, 255)) for _ in range(4099))
+    reps = size // len(block) + 1
+    return (block * reps)[:size]
+
+
+def chunked(data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+class Checker (object):
+
+    def __init__(self, verbose=False):
+        self.failures = []
+        self.checks = 0
+        self.verbose = verbose
+
+    def check(self, label, actual, expected):
+        self.checks += 1
+        if actual != expected:
+            self.failures.append(label)
+            print("FAIL: " + label, file=sys.stderr)
+        elif self.verbose:
+            print("ok: " + label)
+
+
+def check_algorithm(checker, name, canonical, source, sizes):
+    """Check the named algorithm, using prefixes of the source buffer"""
+    stock = stock_constructor(canonical)
+    vectors = KNOWN_VECTORS.get(canonical)
+    if vectors:
+        for msg, expected in zip(('', 'abc', MILLION_A), vectors):
+            label = "{n}: known vector ({size} bytes)".format(
+                n=name, size=len(msg)
+            )
+            checker.check(label, althashlib.new(name, msg).hexdigest(),
+                          expected)
+    elif stock is None:
+        print("WARNING: no reference available for " + name, file=sys.stderr)
+
+    for size in sizes:
+        data = source[:size]
+        whole = althashlib.new(name, data).hexdigest()
+        if stock is not None:
+            checker.check(
+                "{n}: {size} bytes vs stock".format(n=name, size=size),
+                whole, stock(data).hexdigest()
+            )
+        for chunk_size in CHUNK_SIZES:
+            # Avoid millions of single-byte updates for the larger inputs
+            if size // chunk_size > 100000:
+                continue
+            h = althashlib.new(name)
+            for chunk in chunked(data, chunk_size):
+                h.update(chunk)
+            checker.check(
+                "{n}: {size} bytes in chunks of {c}".format(
+                    n=name, size=size, c=chunk_size
+                ),
+                h.hexdigest(), whole
+            )
+        checker.check(
+            "{n}: {size} bytes via hash_buffer".format(n=name, size=size),
+            althashlib.hash_buffer(name, data).encode('hex'), whole
+        )
+
+    # Copies branch off with the same state
+    prefix = althashlib.new(name, 'prefix')
+    branch = prefix.copy()
+    branch.update('suffix')
+    checker.check("{n}: copy".format(n=name), branch.hexdigest(),
+                  althashlib.new(name, 'prefixsuffix').hexdigest())
+    checker.check("{n}: copy leaves original".format(n=name),
+                  prefix.hexdigest(),
+                  althashlib.new(name, 'prefix').hexdigest())
+
+    small = [test_data(s, seed=s) for s in SMALL_SIZES[:-1]]
+    checker.check(
+        "{n}: hash_many".format(n=name),
+        althashlib.hash_many(name, small),
+        [althashlib.new(name, s).digest() for s in small]
+    )
+
+
+def check_files(checker, name, sizes):
+    tmpdir = tempfile.mkdtemp(prefix="althashlib-")
+    paths = []
+    try:
+        for size in sizes:
+            path = os.path.join(tmpdir, "{size}.bin".format(size=size))
+            with open(path, 'wb') as f:
+                f.write(test_data(size))
+            paths.append(path)
+        expected = {
+            p: althashlib.new(name, test_data(s)).digest()
+            for p, s in zip(paths, sizes)
+        }
+        for p in paths:
+            checker.check("{n}: hash_file {p}".format(n=name, p=p),
+                          althashlib.hash_file(p, name), expected[p])
+        checker.check("{n}: hash_files".format(n=name),
+                      althashlib.hash_files(paths, name, workers=4), expected)
+    finally:
+        for p in paths:
+            os.remove(p)
+        os.rmdir(tmpdir)
+
+
+def throughput(constructor, data, number=3):
+    """MB/s for hashing data (best of 3 runs)"""
+    t = min(timeit.repeat(lambda: constructor(data).digest(),
+                          repeat=3, number=number))
+    return number * len(data) / t / MB
+
+
+def call_rate(constructor, number=50000):
+    """Calls/s for hashing a small input (best of 3 runs)"""
+    t = min(timeit.repeat(lambda: constructor('tile-key').digest(),
+                          repeat=3, number=number))
+    return number / t
+
+
+def benchmark(names, size):
+    data = test_data(size)
+    header = "{:<12}{:>14}{:>14}{:>16}{:>16}".format(
+        "algorithm", "MB/s", "stock MB/s", "calls/s", "stock calls/s"
+    )
+    print(header)
+    print("-" * len(header))
+    for name in names:
+        alt = lambda d='': althashlib.new(name, d)
+        stock = stock_constructor(name)
+        row = [throughput(alt, data), None, call_rate(alt), None]
+        if stock is not None:
+            row[1] = throughput(stock, data)
+            row[3] = call_rate(stock)
+        widths = (14, 14, 16, 16)
+        cells = [
+            "{v:>{w},.0f}".format(v=v, w=w) if v is not None
+            else "{v:>{w}}".format(v="-", w=w)
+            for v, w in zip(row, widths)
+        ]
+        print("{:<12}".format(name) + "".join(cells))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-m", "--max-size", type=int, default=256, metavar="MB",
+        help="Size in MiB of the largest input checked (default: 256)"
+    )
+    parser.add_argument(
+        "--bench-size", type=int, default=64, metavar="MB",
+        help="Size in MiB of the input used for throughput (default: 64)"
+    )
+    parser.add_argument(
+        "--no-bench", action="store_true", help="Only run the checks"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Print passing checks"
+    )
+    args = parser.parse_args()
+
+    sizes = [s for s in SMALL_SIZES + LARGE_SIZES if s <= args.max_size * MB]
+    # Inputs are memoryview slices of the same data, to avoid copies
+    source = memoryview(test_data(max(sizes)))
+    # Names that map to the same algorithm are all checked, but only
+    # the first name of each algorithm goes through the full size range.
+    checked = {}
+    checker = Checker(verbose=args.verbose)
+    for name in sorted(althashlib.algorithms_available):
+        canonical = althashlib.new(name).name
+        if canonical in checked:
+            check_algorithm(checker, name, canonical, source, SMALL_SIZES[:4])
+        else:
+            checked[canonical] = name
+            print("Checking {c}".format(c=canonical))
+            check_algorithm(checker, name, canonical, source, sizes)
+            check_files(checker, name, SMALL_SIZES)
+
+    print("{n} checks, {f} failures".format(
+        n=checker.checks, f=len(checker.failures)
+    ))
+    if not args.no_bench:
+        print()
+        benchmark(sorted(checked), args.bench_size * MB)
+    return 1 if checker.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
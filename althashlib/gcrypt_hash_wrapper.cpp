@@ -1,59 +1,524 @@
 #include "gcrypt_hash_wrapper.hpp"
 #include <Python.h>
 #include <gcrypt.h>
+#include <algorithm>
+#include <atomic>
+#include <cctype>
+#include <cerrno>
+#include <cstring>
+#include <system_error>
+#include <thread>
+#include <unordered_map>
+#include <vector>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
-static bool initialized = false;
+static std::once_flag init_flag;
 
-Hasher::Hasher(int hash_type) : hash_type(hash_type) {\
-  active_handle = &handle1;
-  inactive_handle = &handle2;
-  // Initialize libgcrypt
-  if (!initialized) {
-    gcry_check_version(NULL);
-    initialized = true;
+// Per-algorithm state, created on first use of each algorithm
+struct AlgoInfo
+{
+  gcry_error_t status;
+  // Reset handles, ready to be reused by new hashers
+  std::vector<gcry_md_hd_t> handles;
+};
+
+static std::mutex algo_lock;
+static std::unordered_map<int, AlgoInfo> algo_info;
+
+// Process-wide settings (secure memory, finishing the initialization)
+// are left to the application, as other gcrypt users may share them.
+static void init_gcrypt()
+{
+  gcry_check_version(NULL);
+}
+
+// Initialize libgcrypt and verify that the hash type index is valid.
+// Both are only done once (for each algorithm), and are thread-safe.
+static gcry_error_t init_algo(int hash_type)
+{
+  std::call_once(init_flag, init_gcrypt);
+  std::lock_guard<std::mutex> guard(algo_lock);
+  auto it = algo_info.find(hash_type);
+  if (it == algo_info.end()) {
+    it = algo_info.emplace(hash_type, AlgoInfo()).first;
+    it->second.status = gcry_md_test_algo(hash_type);
+  }
+  return it->second.status;
+}
+
+// Take a reset handle from the pool, only opening a new one if it is empty
+static gcry_error_t acquire_handle(int hash_type, gcry_md_hd_t* handle)
+{
+  {
+    std::lock_guard<std::mutex> guard(algo_lock);
+    std::vector<gcry_md_hd_t>& pool = algo_info[hash_type].handles;
+    if (!pool.empty()) {
+      *handle = pool.back();
+      pool.pop_back();
+      return 0;
+    }
+  }
+  return gcry_md_open(handle, hash_type, 0);
+}
+
+// Reset the handle and return it to the pool, or close it if the pool is full
+static void release_handle(int hash_type, gcry_md_hd_t handle)
+{
+  gcry_md_reset(handle);
+  {
+    std::lock_guard<std::mutex> guard(algo_lock);
+    std::vector<gcry_md_hd_t>& pool = algo_info[hash_type].handles;
+    if (pool.size() < MAX_POOLED_HANDLES) {
+      pool.push_back(handle);
+      return;
+    }
   }
-  // Verify that the hash type index is valid
-  gcry_error_t err = gcry_md_test_algo(hash_type);
+  gcry_md_close(handle);
+}
+
+Hasher::Hasher(int hash_type) :
+  hash_type(hash_type), digest_valid(false) {
+  gcry_error_t err = init_algo(hash_type);
   if (err) {
     throw err;
   }
   // Set up the handle for the given hash type
   digest_size_v = gcry_md_get_algo_dlen(hash_type);
-  err = gcry_md_open(active_handle, hash_type, 0);
+  err = acquire_handle(hash_type, &handle);
   if (err) {
     throw err;
   }
 }
 
+// Set up an instance without an open handle, to be filled in by copy()
+Hasher::Hasher(int hash_type, int digest_size) :
+  hash_type(hash_type), digest_size_v(digest_size),
+  handle(NULL), digest_valid(false) {
+}
+
 Hasher::~Hasher() {
-  if (*active_handle) {
-    gcry_md_close(*active_handle);
+  if (handle) {
+    release_handle(hash_type, handle);
   }
 }
 
-uint Hasher::digest_size() {
+int Hasher::digest_size() {
   return digest_size_v;
 }
 
-void Hasher::update(char* data, int size)
+// The block sizes are not exposed by libgcrypt
+int Hasher::block_size() {
+  switch (hash_type) {
+  case GCRY_MD_SHA384:
+  case GCRY_MD_SHA512:
+  case BLAKE2B_512:
+    return 128;
+  case SHA3_224:
+    return 144;
+  case SHA3_256:
+    return 136;
+  case SHA3_384:
+    return 104;
+  case SHA3_512:
+    return 72;
+  case GCRY_MD_CRC32:
+    return 1;  // Not block based
+  default:
+    return 64;
+  }
+}
+
+PyObject* Hasher::name() {
+  // The hashlib names of the BLAKE2 variants omit the digest size
+  switch (hash_type) {
+  case BLAKE2B_512:
+    return PyString_FromString("blake2b");
+  case BLAKE2S_256:
+    return PyString_FromString("blake2s");
+  }
+  // Otherwise the hashlib name is the lower-case libgcrypt name,
+  // with dashes (e.g. in SHA3-256) replaced by underscores.
+  const char* gcry_name = gcry_md_algo_name(hash_type);
+  Py_ssize_t len = strlen(gcry_name);
+  PyObject* ret = PyString_FromStringAndSize(NULL, len);
+  if (!ret) {
+    return NULL;
+  }
+  char* lower = PyString_AS_STRING(ret);
+  for (Py_ssize_t i = 0; i < len; ++i) {
+    lower[i] = gcry_name[i] == '-' ? '_' : tolower(gcry_name[i]);
+  }
+  return ret;
+}
+
+// Get a read-only view of the object's data, without copying it.
+// Objects only supporting the old buffer protocol (e.g. mmap) are
+// handled too; a reference to the object is held by the view either way.
+static bool get_buffer(PyObject* obj, Py_buffer* view)
+{
+  if (PyUnicode_Check(obj)) {
+    PyErr_SetString(PyExc_TypeError,
+                    "Unicode-objects must be encoded before hashing");
+    return false;
+  }
+  if (PyObject_CheckBuffer(obj)) {
+    return PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) == 0;
+  }
+  const void* buf;
+  Py_ssize_t len;
+  if (PyObject_AsReadBuffer(obj, &buf, &len)) {
+    return false;
+  }
+  return PyBuffer_FillInfo(view, obj, (void*) buf, len, 1, PyBUF_SIMPLE) == 0;
+}
+
+// The GIL is held by the caller, and the handle may be locked by a thread
+// hashing a large buffer without it. That thread does not need the GIL to
+// finish, but waiting for it with the GIL held would block all others.
+void Hasher::acquire()
+{
+  if (!lock.try_lock()) {
+    Py_BEGIN_ALLOW_THREADS
+    lock.lock();
+    Py_END_ALLOW_THREADS
+  }
+}
+
+void Hasher::update(PyObject* data)
 {
-  gcry_md_write(*active_handle, data, size);
+  Py_buffer view;
+  if (!get_buffer(data, &view)) {
+    return;
+  }
+  if (view.len < GIL_MINSIZE) {
+    acquire();
+    gcry_md_write(handle, view.buf, (size_t) view.len);
+    digest_valid = false;
+    lock.unlock();
+  } else {
+    Py_BEGIN_ALLOW_THREADS
+    lock.lock();
+    gcry_md_write(handle, view.buf, (size_t) view.len);
+    digest_valid = false;
+    lock.unlock();
+    Py_END_ALLOW_THREADS
+  }
+  PyBuffer_Release(&view);
+}
+
+bool Hasher::finalize()
+{
+  if (digest_valid) {
+    return true;
+  }
+  // Reading the digest finalizes the handle, invalidating further updates,
+  // so the digest is read from a throwaway copy of the current state.
+  gcry_md_hd_t tmp;
+  gcry_error_t err = gcry_md_copy(&tmp, handle);
+  if (err) {
+    PyErr_SetString(PyExc_MemoryError, gcry_strerror(err));
+    return false;
+  }
+  memcpy(digest_v, gcry_md_read(tmp, hash_type), digest_size_v);
+  gcry_md_close(tmp);
+  digest_valid = true;
+  return true;
 }
 
 PyObject* Hasher::digest()
 {
-   // Copy the active handle to the inactive handle
-    gcry_md_copy(inactive_handle, *active_handle);
-    // Get the digest - finalizes the active handle, invalidating further ops
-    const unsigned char* result = gcry_md_read(*active_handle, hash_type);
-    // Copy digest to python string
-    PyObject* ret = PyString_FromStringAndSize((const char*)result, digest_size_v);
-    // Close the handle (might not be necessary in this case)
-    gcry_md_close(*active_handle);
-    // Swap the active and inactive states
-    gcry_md_hd_t* tmp = active_handle;
-    active_handle = inactive_handle;
-    inactive_handle = tmp;
-
-    return ret;
+  acquire();
+  std::lock_guard<std::mutex> guard(lock, std::adopt_lock);
+  if (!finalize()) {
+    return NULL;
+  }
+  return PyString_FromStringAndSize((const char*) digest_v, digest_size_v);
+}
+
+PyObject* Hasher::hexdigest()
+{
+  static const char hexdigits[] = "0123456789abcdef";
+  acquire();
+  std::lock_guard<std::mutex> guard(lock, std::adopt_lock);
+  if (!finalize()) {
+    return NULL;
+  }
+  PyObject* ret = PyString_FromStringAndSize(NULL, 2 * digest_size_v);
+  if (!ret) {
+    return NULL;
+  }
+  char* hex = PyString_AS_STRING(ret);
+  for (int i = 0; i < digest_size_v; ++i) {
+    hex[2 * i] = hexdigits[digest_v[i] >> 4];
+    hex[2 * i + 1] = hexdigits[digest_v[i] & 0xf];
+  }
+  return ret;
+}
+
+Hasher* Hasher::copy()
+{
+  Hasher* clone = new Hasher(hash_type, digest_size_v);
+  gcry_error_t err;
+  {
+    acquire();
+    std::lock_guard<std::mutex> guard(lock, std::adopt_lock);
+    err = gcry_md_copy(&clone->handle, handle);
+    // Carry over any cached digest, since the state is identical
+    clone->digest_valid = digest_valid;
+    memcpy(clone->digest_v, digest_v, digest_size_v);
+  }
+  if (err) {
+    delete clone;
+    PyErr_SetString(PyExc_MemoryError, gcry_strerror(err));
+    return NULL;
+  }
+  return clone;
+}
+
+bool algo_available(int hash_type)
+{
+  return init_algo(hash_type) == 0;
+}
+
+// Raise a python exception if the algorithm cannot be used
+static bool check_algo(int hash_type)
+{
+  gcry_error_t err = init_algo(hash_type);
+  if (err) {
+    PyErr_SetString(PyExc_ValueError, gcry_strerror(err));
+    return false;
+  }
+  return true;
+}
+
+PyObject* hash_buffer(int hash_type, PyObject* data)
+{
+  if (!check_algo(hash_type)) {
+    return NULL;
+  }
+  Py_buffer view;
+  if (!get_buffer(data, &view)) {
+    return NULL;
+  }
+  unsigned char digest[MAX_DIGEST_SIZE];
+  if (view.len < GIL_MINSIZE) {
+    gcry_md_hash_buffer(hash_type, digest, view.buf, (size_t) view.len);
+  } else {
+    Py_BEGIN_ALLOW_THREADS
+    gcry_md_hash_buffer(hash_type, digest, view.buf, (size_t) view.len);
+    Py_END_ALLOW_THREADS
+  }
+  PyBuffer_Release(&view);
+  return PyString_FromStringAndSize(
+      (const char*) digest, gcry_md_get_algo_dlen(hash_type));
+}
+
+PyObject* hash_many(int hash_type, PyObject* buffers)
+{
+  if (!check_algo(hash_type)) {
+    return NULL;
+  }
+  PyObject* seq = PySequence_Fast(buffers, "argument must be iterable");
+  if (!seq) {
+    return NULL;
+  }
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  int dsize = gcry_md_get_algo_dlen(hash_type);
+  std::vector<Py_buffer> views(n);
+  std::vector<unsigned char> digests(n * dsize);
+  PyObject* ret = NULL;
+
+  // Acquire views of all buffers before releasing the GIL
+  Py_ssize_t acquired = 0;
+  for (; acquired < n; ++acquired) {
+    PyObject* item = PySequence_Fast_GET_ITEM(seq, acquired);
+    if (!get_buffer(item, &views[acquired])) {
+      goto cleanup;
+    }
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  for (Py_ssize_t i = 0; i < n; ++i) {
+    gcry_md_hash_buffer(
+        hash_type, &digests[i * dsize], views[i].buf, (size_t) views[i].len);
+  }
+  Py_END_ALLOW_THREADS
+
+  ret = PyList_New(n);
+  if (!ret) {
+    goto cleanup;
+  }
+  for (Py_ssize_t i = 0; i < n; ++i) {
+    PyObject* digest = PyString_FromStringAndSize(
+        (const char*) &digests[i * dsize], dsize);
+    if (!digest) {
+      Py_CLEAR(ret);
+      goto cleanup;
+    }
+    PyList_SET_ITEM(ret, i, digest);
+  }
+
+cleanup:
+  for (Py_ssize_t i = 0; i < acquired; ++i) {
+    PyBuffer_Release(&views[i]);
+  }
+  Py_DECREF(seq);
+  return ret;
+}
+
+// Fallback for files that cannot be memory-mapped (pipes, devices etc.)
+static int digest_fd_stream(int hash_type, int fd, unsigned char* digest)
+{
+  gcry_md_hd_t hd;
+  if (gcry_md_open(&hd, hash_type, 0)) {
+    return ENOMEM;
+  }
+  std::vector<char> chunk(1 << 16);
+  ssize_t n;
+  while ((n = read(fd, chunk.data(), chunk.size())) != 0) {
+    if (n < 0) {
+      if (errno == EINTR) {
+        continue;
+      }
+      int err = errno;
+      gcry_md_close(hd);
+      return err;
+    }
+    gcry_md_write(hd, chunk.data(), n);
+  }
+  memcpy(digest, gcry_md_read(hd, hash_type), gcry_md_get_algo_dlen(hash_type));
+  gcry_md_close(hd);
+  return 0;
+}
+
+// Hash the file at the given path, without touching any python state.
+// Returns 0 on success, or an errno value on failure.
+static int digest_file(int hash_type, const char* path, unsigned char* digest)
+{
+  int fd = open(path, O_RDONLY | O_CLOEXEC);
+  if (fd < 0) {
+    return errno;
+  }
+  struct stat st;
+  if (fstat(fd, &st)) {
+    int err = errno;
+    close(fd);
+    return err;
+  }
+  int err = 0;
+  if (S_ISREG(st.st_mode) && st.st_size == 0) {
+    gcry_md_hash_buffer(hash_type, digest, "", 0);
+  } else if (S_ISREG(st.st_mode)) {
+    void* data = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (data != MAP_FAILED) {
+      madvise(data, st.st_size, MADV_SEQUENTIAL);
+      gcry_md_hash_buffer(hash_type, digest, data, st.st_size);
+      munmap(data, st.st_size);
+    } else {
+      err = digest_fd_stream(hash_type, fd, digest);
+    }
+  } else {
+    err = digest_fd_stream(hash_type, fd, digest);
+  }
+  close(fd);
+  return err;
+}
+
+static PyObject* set_file_error(int err, const char* path)
+{
+  errno = err;
+  return PyErr_SetFromErrnoWithFilename(PyExc_IOError, path);
+}
+
+PyObject* hash_file(int hash_type, const char* path)
+{
+  if (!check_algo(hash_type)) {
+    return NULL;
+  }
+  unsigned char digest[MAX_DIGEST_SIZE];
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = digest_file(hash_type, path, digest);
+  Py_END_ALLOW_THREADS
+  if (err) {
+    return set_file_error(err, path);
+  }
+  return PyString_FromStringAndSize(
+      (const char*) digest, gcry_md_get_algo_dlen(hash_type));
+}
+
+PyObject* hash_files(int hash_type, PyObject* paths, int workers)
+{
+  if (!check_algo(hash_type)) {
+    return NULL;
+  }
+  PyObject* seq = PySequence_Fast(paths, "paths must be iterable");
+  if (!seq) {
+    return NULL;
+  }
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  std::vector<const char*> cpaths(n);
+  for (Py_ssize_t i = 0; i < n; ++i) {
+    PyObject* item = PySequence_Fast_GET_ITEM(seq, i);
+    if (!PyString_Check(item)) {
+      PyErr_SetString(PyExc_TypeError, "paths must be str objects");
+      Py_DECREF(seq);
+      return NULL;
+    }
+    cpaths[i] = PyString_AS_STRING(item);
+  }
+
+  int dsize = gcry_md_get_algo_dlen(hash_type);
+  std::vector<unsigned char> digests(n * dsize);
+  std::vector<int> errors(n, 0);
+  if (workers <= 0) {
+    workers = std::max(1u, std::thread::hardware_concurrency());
+  }
+  workers = (int) std::min((Py_ssize_t) workers, std::max(n, (Py_ssize_t) 1));
+
+  // Each worker claims the next unprocessed file until none remain
+  Py_BEGIN_ALLOW_THREADS
+  std::atomic<Py_ssize_t> next(0);
+  auto work = [&]() {
+    Py_ssize_t i;
+    while ((i = next++) < n) {
+      errors[i] = digest_file(hash_type, cpaths[i], &digests[i * dsize]);
+    }
+  };
+  std::vector<std::thread> pool;
+  for (int w = 1; w < workers; ++w) {
+    try {
+      pool.emplace_back(work);
+    } catch (const std::system_error&) {
+      break;  // Carry on with the threads that could be started
+    }
+  }
+  work();
+  for (auto& t : pool) {
+    t.join();
+  }
+  Py_END_ALLOW_THREADS
+
+  PyObject* ret = PyDict_New();
+  for (Py_ssize_t i = 0; ret && i < n; ++i) {
+    if (errors[i]) {
+      set_file_error(errors[i], cpaths[i]);
+      Py_CLEAR(ret);
+      break;
+    }
+    PyObject* digest = PyString_FromStringAndSize(
+        (const char*) &digests[i * dsize], dsize);
+    if (!digest ||
+        PyDict_SetItem(ret, PySequence_Fast_GET_ITEM(seq, i), digest)) {
+      Py_XDECREF(digest);
+      Py_CLEAR(ret);
+      break;
+    }
+    Py_DECREF(digest);
+  }
+  Py_DECREF(seq);
+  return ret;
 }
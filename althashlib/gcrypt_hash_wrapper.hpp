@@ -3,9 +3,21 @@
 
 #include <Python.h>
 #include <gcrypt.h>
+#include <mutex>
 
 #define GCRYPT_NO_DEPRECATED
 
+// Inputs smaller than this (in bytes) are hashed without releasing the GIL,
+// since the cost of releasing and reacquiring it would dominate.
+// Same threshold as the one used by the regular hashlib.
+const Py_ssize_t GIL_MINSIZE = 2048;
+
+// The maximum number of idle handles kept for reuse, per algorithm
+const size_t MAX_POOLED_HANDLES = 16;
+
+// Large enough for the longest digest of the supported algorithms
+const int MAX_DIGEST_SIZE = 64;
+
 // THe subset of algorithms in libgcrypt with implementations
 // (and that are available in the particular version of libgcrypt
 // that this wrapper supports)
@@ -18,6 +30,17 @@ const int SHA256 = GCRY_MD_SHA256;
 const int SHA384 = GCRY_MD_SHA384;
 const int SHA512 = GCRY_MD_SHA512;
 const int WHIRLPOOL = GCRY_MD_WHIRLPOOL;
+const int CRC32 = GCRY_MD_CRC32;
+
+// Algorithms that only newer versions of libgcrypt implement. Whether they
+// can be used depends on the library loaded at runtime (see algo_available),
+// so they are defined by value, the enum names being absent in older headers.
+const int SHA3_224 = 312;  // GCRY_MD_SHA3_224, libgcrypt >= 1.7
+const int SHA3_256 = 313;  // GCRY_MD_SHA3_256, libgcrypt >= 1.7
+const int SHA3_384 = 314;  // GCRY_MD_SHA3_384, libgcrypt >= 1.7
+const int SHA3_512 = 315;  // GCRY_MD_SHA3_512, libgcrypt >= 1.7
+const int BLAKE2B_512 = 318;  // GCRY_MD_BLAKE2B_512, libgcrypt >= 1.8
+const int BLAKE2S_256 = 322;  // GCRY_MD_BLAKE2S_256, libgcrypt >= 1.8
 
 // Could be exposed, but won't be
 // const int TIGER = GCRY_MD_TIGER;
@@ -26,7 +49,6 @@ const int WHIRLPOOL = GCRY_MD_WHIRLPOOL;
 // const int GOSTR3411_94 = GCRY_MD_GOSTR3411_94;
 // const int STRIBOG256 = GCRY_MD_STRIBOG256;
 // const int STRIBOG512 = GCRY_MD_STRIBOG512;
-// const int CRC32 = GCRY_MD_CRC32;
 // const int CRC32_RFC1510 = GCRY_MD_CRC32_RFC1510;
 // const int CRC24_RFC2440 = GCRY_MD_CRC24_RFC2440;
 
@@ -40,19 +62,51 @@ class Hasher
 public:
   explicit Hasher(int hash_type);
   ~Hasher();
-  uint digest_size();
-  void update(char *data, int size);
+  int digest_size();
+  int block_size();
+  // The hashlib name of the algorithm, e.g. 'sha256'
+  PyObject* name();
+  // Accepts any object supporting the buffer protocol
+  void update(PyObject *data);
   PyObject* digest();
+  PyObject* hexdigest();
+  // Returns a new hasher with the same internal state
+  Hasher* copy();
 
 private:
+  Hasher(int hash_type, int digest_size);
+  // Lock the handle, releasing the GIL while waiting for it
+  void acquire();
+  // Compute the digest, unless the cached one is still valid
+  bool finalize();
   int hash_type;
   int digest_size_v;
-  // Up to two handles are stored, to allow access to the digest between
-  // calls to ``update``. Only one of them is active at at any one time.
-  gcry_md_hd_t handle1;
-  gcry_md_hd_t handle2;
-  gcry_md_hd_t* active_handle;
-  gcry_md_hd_t* inactive_handle;
+  gcry_md_hd_t handle;
+  // The digest is cached until the next call to ``update``,
+  // so that repeated reads do not require finalizing the state again.
+  unsigned char digest_v[MAX_DIGEST_SIZE];
+  bool digest_valid;
+  // Guards the handle while the GIL is released
+  std::mutex lock;
 };
 
+// Whether the algorithm is implemented by the runtime version of libgcrypt
+bool algo_available(int hash_type);
+
+// One-shot hashing of a single buffer, returning the digest
+PyObject* hash_buffer(int hash_type, PyObject *data);
+
+// Hash every buffer of an iterable separately, returning a list of digests.
+// All buffers are hashed in a single loop, with the GIL released.
+PyObject* hash_many(int hash_type, PyObject *buffers);
+
+// Hash the contents of a file, memory-mapping it when possible.
+// The file is read and hashed with the GIL released.
+PyObject* hash_file(int hash_type, const char *path);
+
+// Hash a sequence of files using a pool of native threads, returning
+// a dict mapping each path to its digest. Passing 0 for the number
+// of workers uses one thread per core.
+PyObject* hash_files(int hash_type, PyObject *paths, int workers);
+
 #endif // include guard
@@ -1,6 +1,19 @@
 %module gcrypt_hash_wrapper;
 
-%apply (char *STRING, int LENGTH) { (char *data, int size) };
+// Errors are reported by setting the python exception state,
+// or by throwing a libgcrypt error code (from the Hasher constructor).
+%exception {
+  try {
+    $action
+  } catch (gcry_error_t err) {
+    PyErr_SetString(PyExc_ValueError, gcry_strerror(err));
+    SWIG_fail;
+  }
+  if (PyErr_Occurred()) SWIG_fail;
+}
+
+// The python proxy takes ownership of copies
+%newobject Hasher::copy;
 
 %{
 #include "gcrypt_hash_wrapper.hpp"
@@ -2,25 +2,55 @@
 
 """
 setup.py file for SWIG example
+
+The extension backend is picked with the ALTHASHLIB_BACKEND environment
+variable: "capi" (the default) builds the hand-written extension module,
+"swig" builds the SWIG wrapper and "both" builds the two of them.
+althashlib uses the hand-written module when it is available.
 """
 
+import os
 from distutils.core import setup, Extension
 
 
-althashlib_module = Extension(
+common_options = dict(
+    language='c++',
+    extra_compile_args=['--std=c++11', '-Os', '-pthread'],
+    extra_link_args=['-lgcrypt', '-pthread'],
+)
+
+capi_module = Extension(
+    '_althash',
+    sources=['althash_module.cpp', 'gcrypt_hash_wrapper.cpp'],
+    **common_options
+)
+
+swig_module = Extension(
     '_gcrypt_hash_wrapper',
     sources=['gcrypt_hash_wrapper.i', 'gcrypt_hash_wrapper.cpp'],
     swig_opts=['-c++'],
-    language='c++',
-    extra_compile_args=['--std=c++11', '-Os'],
-    extra_link_args=['-lgcrypt'],
+    **common_options
 )
 
+backends = {
+    'capi': [capi_module],
+    'swig': [swig_module],
+    'both': [capi_module, swig_module],
+}
+
+backend = os.environ.get('ALTHASHLIB_BACKEND', 'capi')
+if backend not in backends:
+    raise SystemExit(
+        "Unknown ALTHASHLIB_BACKEND: {b} (valid values: {valid})".format(
+            b=backend, valid=", ".join(sorted(backends))
+        )
+    )
+
 setup(
     name='althashlib',
     version='0.1',
     author="Jesper Lloyd",
     description="Small slot-in replacement for hashlib, using libgcrypt",
-    ext_modules=[althashlib_module],
+    ext_modules=backends[backend],
     py_modules=["althashlib"],
 )
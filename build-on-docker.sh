@@ -41,5 +41,5 @@ check_prerequisites mypaint libmypaint mypaint-brushes
 # If the check passes, start the appimage build in a docker container
 # Pass in the USER envvar for convenience when building images locally,
 # so that permissions don't have to be updated after each build.
-docker run -it -eUSERID="$(id -u)" -v "${SCRIPTDIR}:/sources" \
+docker run -it -eUSERID="$(id -u)" -eBYTECODE_MODE -eBRUSH_MINIFY_AGGRESSIVE -ePREVIOUS_APPIMAGE -ePREVIOUS_APPIMAGE_NO_TRANSLATIONS -eZSYNC_VARIANTS -v "${SCRIPTDIR}:/sources" \
        "$DOCKER_IMAGE" scl enable devtoolset-8 "bash -c /sources/$APPIM_INIT_SCRIPT"
@@ -28,9 +28,14 @@ cd "$APPIM_SOURCES/mypaint-brushes"
 ./autogen.sh --prefix=/usr/local
 ./configure --prefix=/usr/local
 make install
-# Minify brushes after install
-find /usr/local/share/mypaint-data/ -name "*.myb" |
-    xargs "$APPIM_SOURCES/scripts/helpers/brushfile-minifier.py" ../libmypaint/brushsettings.json
+# Minify brushes after install (set BRUSH_MINIFY_AGGRESSIVE=1 to also
+# shorten setting values and remove no-op input mappings, with verification)
+minify_opts=
+if [ "$BRUSH_MINIFY_AGGRESSIVE" = 1 ]; then
+    minify_opts=--aggressive
+fi
+"$APPIM_SOURCES/scripts/helpers/brushfile-minifier.py" --batch $minify_opts \
+    ../libmypaint/brushsettings.json /usr/local/share/mypaint-data/
 
 
 cd "$APPIM_SOURCES/mypaint"
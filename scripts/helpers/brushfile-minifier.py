@@ -4,13 +4,49 @@
 # provided that they have no input mappings (brush dynamics).
 # The exception is the paint_mode setting, which is retained
 # even if it is default.
+#
+# With --batch, the brush files (or directories of brush files) are
+# minified in parallel, and only the files whose minified output differs
+# from their current contents are (atomically) rewritten.
+#
+# With --archive, the minified brushes are instead packed into a single
+# indexed archive, that can be memory-mapped and read by brush name
+# (see BrushArchive), and --benchmark compares loading the brushes from
+# the archive with loading them from the individual files.
+#
+# With --aggressive (in batch and archive modes), setting values are also
+# rounded to the shortest decimals that libmypaint reads as the same single
+# precision floats, and input mappings that always evaluate to 0 are removed.
+# Each aggressively minified brush is checked to evaluate exactly like the
+# original, using a model of libmypaint's mapping calculation; brushes that
+# do not are minified the regular way instead, and are listed in the report.
 
 import json
+import math
+import mmap
+import os
+import struct
 import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from multiprocessing import Pool
 
 CNKEY = "internal_name"
 SKIP = {"paint_mode"}
 
+# Archive layout: header, index, data. All integers are little-endian.
+# The index entries are sorted by name, and the offsets in the index
+# are relative to the start of the data section.
+ARCHIVE_MAGIC = b"MYBPACK1"
+ARCHIVE_HEADER = struct.Struct("<8sII")  # magic, entry count, index size
+ARCHIVE_ENTRY = struct.Struct("<HII")  # name length, data offset, length
+
+# Ranges of the input values, added to the points where mappings are compared
+INPUT_RANGE_KEYS = (
+    "hard_minimum", "soft_minimum", "normal", "soft_maximum", "hard_maximum",
+)
+
 
 def get_setting_defaults(brushsettings_filename):
     with open(brushsettings_filename) as f:
@@ -19,6 +55,21 @@ def get_setting_defaults(brushsettings_filename):
     return {s[CNKEY]: s["default"] for s in settings if s[CNKEY] not in SKIP}
 
 
+def get_brush_definitions(brushsettings_filename):
+    """
+    The defaults of all settings, and the (id, range values) of all inputs,
+    in the order libmypaint evaluates them, for aggressive minification.
+    """
+    with open(brushsettings_filename) as f:
+        brushsettings = json.loads(f.read())
+    settings = {s[CNKEY]: s["default"] for s in brushsettings["settings"]}
+    inputs = [
+        (i["id"], [i[k] for k in INPUT_RANGE_KEYS if i.get(k) is not None])
+        for i in brushsettings["inputs"]
+    ]
+    return settings, inputs
+
+
 def strip_defaults(brush, defaults):
     settings_dict = brush["settings"]
     settings_to_remove = set()
@@ -34,10 +85,395 @@ def strip_defaults(brush, defaults):
     return brush
 
 
+def f32(value):
+    """The value rounded to single precision, as stored by libmypaint"""
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+def shortest_float(value):
+    """The float with the shortest repr that is the same in single precision"""
+    if math.isinf(value) or math.isnan(value) or abs(value) > 3.4e38:
+        return value
+    single = f32(value)
+    for digits in range(1, 10):
+        candidate = float("%.*g" % (digits, single))
+        if f32(candidate) == single:
+            return candidate
+    return value
+
+
+def is_noop_mapping(points):
+    """Whether the mapping curve adds 0 to the base value for any input"""
+    return not points or (len(points) > 1 and all(y == 0 for _, y in points))
+
+
+def mapping_value(setting, input_ids, data):
+    """
+    The value of a setting for the given input values, calculated the way
+    libmypaint does it (mypaint_mapping_calculate), in single precision.
+    """
+    result = f32(setting.get("base_value", 0.0))
+    for input_id in input_ids:
+        points = setting["inputs"].get(input_id)
+        if not points:
+            continue
+        xs = [f32(x) for x, _ in points]
+        ys = [f32(y) for _, y in points]
+        if len(points) == 1:
+            result = f32(result + ys[0])
+            continue
+        x = f32(data[input_id])
+        x0, y0, x1, y1 = xs[0], ys[0], xs[1], ys[1]
+        for i in range(2, len(points)):
+            if not x > x1:
+                break
+            x0, y0, x1, y1 = x1, y1, xs[i], ys[i]
+        if x0 == x1 or y0 == y1:
+            y = y0
+        else:
+            y = f32(
+                f32(f32(y1 * f32(x - x0)) + f32(y0 * f32(x1 - x)))
+                / f32(x1 - x0))
+        result = f32(result + y)
+    return result
+
+
+def input_samples(ranges, *curves):
+    """Input values around and between the points of the given curves"""
+    values = set([0.0] + ranges)
+    for points in curves:
+        xs = sorted(x for x, _ in points or [])
+        values.update(xs)
+        values.update((a + b) / 2.0 for a, b in zip(xs, xs[1:]))
+    low, high = min(values), max(values)
+    values.update([low - 1.0, high + 1.0])
+    return sorted(values)
+
+
+def differing_settings(original, minified, definitions):
+    """Names of the settings that do not evaluate identically"""
+    setting_defaults, inputs = definitions
+    input_ids = [input_id for input_id, _ in inputs]
+    differing = []
+    for cname, default in sorted(setting_defaults.items()):
+        unset = {"base_value": default, "inputs": {}}
+        a = original["settings"].get(cname, unset)
+        b = minified["settings"].get(cname, unset)
+        samples = {
+            input_id: input_samples(
+                ranges, a["inputs"].get(input_id), b["inputs"].get(input_id))
+            for input_id, ranges in inputs
+        }
+        # All inputs are varied together - the mappings are independent
+        count = max(len(v) for v in samples.values()) if samples else 1
+        for i in range(count):
+            data = {k: v[i % len(v)] for k, v in samples.items()}
+            if (mapping_value(a, input_ids, data) !=
+                    mapping_value(b, input_ids, data)):
+                differing.append(cname)
+                break
+    return differing
+
+
+def aggressive_strip(brush, defaults, definitions):
+    """
+    Canonicalize the values of known settings, remove their no-op input
+    mappings, and then strip the settings that are left with defaults.
+    """
+    for cname, values in brush["settings"].items():
+        if cname not in definitions[0]:
+            continue
+        if isinstance(values.get("base_value"), float):
+            values["base_value"] = shortest_float(values["base_value"])
+        inputs = values["inputs"]
+        for input_id, points in list(inputs.items()):
+            if is_noop_mapping(points):
+                inputs.pop(input_id)
+            else:
+                inputs[input_id] = [
+                    [shortest_float(v) if isinstance(v, float) else v
+                     for v in point]
+                    for point in points
+                ]
+    return strip_defaults(brush, defaults)
+
+
 def compact_json_string(data):
     return json.dumps(data, separators=(',', ':'))
 
 
+def find_brush_files(paths):
+    """
+    (name, path) pairs for the given .myb files, and for all .myb files
+    under the given directories. Brushes are named by their path relative
+    to the directory (without the extension), like MyPaint names them.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for f in sorted(files):
+                    if f.endswith(".myb"):
+                        bfile = os.path.join(root, f)
+                        name = os.path.relpath(bfile, path)[:-len(".myb")]
+                        yield name, bfile
+        else:
+            yield os.path.splitext(os.path.basename(path))[0], path
+
+
+def write_atomic(path, data):
+    """Replace the file contents via a temporary file and a rename"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, 'w') as fw:
+            fw.write(data)
+        os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+# Setting defaults of the batch worker processes, and the brush
+# definitions when minifying aggressively (None otherwise)
+_defaults = None
+_definitions = None
+
+
+def _init_worker(defaults, definitions):
+    global _defaults, _definitions
+    _defaults = defaults
+    _definitions = definitions
+
+
+def minified_brush(bfile):
+    """
+    The contents of a brush file, its minified form, and when minifying
+    aggressively, the settings that failed verification (if any - the
+    regular minification is used for those brushes).
+    """
+    with open(bfile) as fr:
+        original = fr.read()
+    brush = strip_defaults(json.loads(original), _defaults)
+    if _definitions is None:
+        return original, compact_json_string(brush), None
+    aggressive = aggressive_strip(
+        json.loads(original), _defaults, _definitions)
+    differing = differing_settings(
+        json.loads(original), aggressive, _definitions)
+    if differing:
+        return original, compact_json_string(brush), differing
+    return original, compact_json_string(aggressive), []
+
+
+def minify_file(bfile):
+    """
+    Minify a brush file in place, only writing it if the output differs.
+    Returns the file, its sizes before and after, and verification result.
+    """
+    original, minified, differing = minified_brush(bfile)
+    if minified != original:
+        write_atomic(bfile, minified)
+    return bfile, len(original), len(minified), differing
+
+
+def minify_all(settings_file, func, brush_files, jobs=None, aggressive=False):
+    """
+    Apply the function to all brush files using a pool of processes,
+    with the settings file only being loaded once
+    """
+    defaults = get_setting_defaults(settings_file)
+    definitions = None
+    if aggressive:
+        definitions = get_brush_definitions(settings_file)
+    pool = Pool(jobs, _init_worker, (defaults, definitions))
+    try:
+        return pool.map(func, brush_files, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def verification_report(results, report_file=None):
+    """
+    Print the brushes that failed verification, and a summary, and
+    optionally write the (name, size before, size after, differing
+    settings) results as json.
+    """
+    failed = [(name, diff) for name, _, _, diff in results if diff]
+    for name, differing in failed:
+        print("Verification failed, minified regularly: %s (%s)" % (
+            name, ", ".join(differing)))
+    print("Verified %d of %d aggressively minified brushes" % (
+        len(results) - len(failed), len(results)))
+    if report_file:
+        with open(report_file, "w") as fw:
+            json.dump({
+                "verified": len(results) - len(failed),
+                "failed": len(failed),
+                "brushes": [
+                    {"name": name, "before": before, "after": after,
+                     "differing": differing}
+                    for name, before, after, differing in results
+                ],
+            }, fw, indent=1, sort_keys=True)
+
+
+def batch_strip_files(settings_file, paths, jobs=None,
+                      aggressive=False, report_file=None):
+    """Minify all brush files in place, printing a summary"""
+    brush_files = sorted(set(p for _, p in find_brush_files(paths)))
+    results = minify_all(
+        settings_file, minify_file, brush_files, jobs, aggressive)
+    changed = sum(1 for _, before, after, _ in results if before != after)
+    before = sum(r[1] for r in results)
+    after = sum(r[2] for r in results)
+    print("Minified %d of %d brush files, %d -> %d bytes (%d saved)" % (
+        changed, len(results), before, after, before - after))
+    if aggressive:
+        verification_report(results, report_file)
+    return 0
+
+
+def _utf8(s):
+    # Under python 2, names and data read from files are already bytes
+    return s if isinstance(s, bytes) else s.encode("utf-8")
+
+
+def write_archive(archive_file, brushes):
+    """Write (name, compact json string) pairs to a packed brush archive"""
+    index = []
+    blobs = []
+    offset = 0
+    for name, data in sorted(brushes):
+        name = _utf8(name)
+        data = _utf8(data)
+        index.append(ARCHIVE_ENTRY.pack(len(name), offset, len(data)) + name)
+        blobs.append(data)
+        offset += len(data)
+    index = b"".join(index)
+    header = ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(blobs), len(index))
+    tmp = archive_file + ".tmp"
+    with open(tmp, "wb") as fw:
+        fw.write(header)
+        fw.write(index)
+        for data in blobs:
+            fw.write(data)
+    os.rename(tmp, archive_file)
+    return len(header) + len(index) + offset
+
+
+class BrushArchive(object):
+    """
+    Read-only access to a packed brush archive. Only the index is read
+    when opening the archive; the brushes are parsed when requested.
+    """
+
+    def __init__(self, archive_file):
+        with open(archive_file, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, index_size = ARCHIVE_HEADER.unpack_from(self._map)
+        if magic != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError("Not a brush archive: %s" % archive_file)
+        self._index = {}
+        pos = ARCHIVE_HEADER.size
+        data_start = pos + index_size
+        for _ in range(count):
+            name_len, offset, length = ARCHIVE_ENTRY.unpack_from(
+                self._map, pos)
+            pos += ARCHIVE_ENTRY.size
+            name = self._map[pos:pos + name_len].decode("utf-8")
+            pos += name_len
+            self._index[name] = (data_start + offset, length)
+
+    def names(self):
+        return sorted(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def raw(self, name):
+        """The compact json string of the named brush"""
+        start, length = self._index[name]
+        return self._map[start:start + length].decode("utf-8")
+
+    def load(self, name):
+        """The parsed brush data of the named brush"""
+        return json.loads(self.raw(name))
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def archive_brush(name_and_path):
+    name, bfile = name_and_path
+    original, minified, differing = minified_brush(bfile)
+    return name, minified, (name, len(original), len(minified), differing)
+
+
+def archive_files(settings_file, paths, archive_file, jobs=None,
+                  aggressive=False, report_file=None):
+    """Pack the minified brushes into an archive, printing a summary"""
+    brushes = dict(find_brush_files(paths))
+    packed = minify_all(
+        settings_file, archive_brush, sorted(brushes.items()), jobs,
+        aggressive)
+    before = sum(os.path.getsize(p) for p in brushes.values())
+    after = write_archive(archive_file, [p[:2] for p in packed])
+    print("Packed %d brush files, %d -> %d bytes, to %s" % (
+        len(packed), before, after, archive_file))
+    if aggressive:
+        verification_report([p[2] for p in packed], report_file)
+    return 0
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.time()
+        func()
+        times.append(time.time() - t)
+    return min(times)
+
+
+def benchmark(archive_file, paths, repeat=5):
+    """
+    Compare loading all brushes from the individual files with loading
+    them from the archive, and loading a single brush from the archive.
+    """
+    brushes = sorted(find_brush_files(paths))
+
+    def load_files():
+        for _, bfile in brushes:
+            with open(bfile) as fr:
+                json.loads(fr.read())
+
+    def load_archive():
+        with BrushArchive(archive_file) as archive:
+            for name in archive.names():
+                archive.load(name)
+
+    def load_one():
+        with BrushArchive(archive_file) as archive:
+            archive.load(brushes[len(brushes) // 2][0])
+
+    print("Best of %d runs, %d brushes:" % (repeat, len(brushes)))
+    for label, func in (("Individual files", load_files),
+                        ("Archive, all brushes", load_archive),
+                        ("Archive, single brush", load_one)):
+        print("  %-22s %8.2f ms" % (label, best_time(func, repeat) * 1000))
+    return 0
+
+
 def strip_files(settings_file, *brush_files):
     defaults = get_setting_defaults(settings_file)
     for bfile in brush_files:
@@ -48,7 +484,69 @@ def strip_files(settings_file, *brush_files):
             fw.write(compact_json_string(strip_defaults(bjson, defaults)))
 
 
+def main():
+    parser = ArgumentParser(description="Minify MyPaint brush files")
+    parser.add_argument(
+        "settings_file", metavar="brushsettings.json",
+        help="The brush settings definitions of libmypaint",
+    )
+    parser.add_argument(
+        "brush_files", metavar="PATH", nargs="+",
+        help="Brush files (.myb) to minify, or in batch and archive modes, "
+             "directories to search for brush files",
+    )
+    parser.add_argument(
+        "-b", "--batch", action="store_true",
+        help="Minify all files in parallel, only rewriting changed files, "
+             "and print a summary instead of each file name",
+    )
+    parser.add_argument(
+        "-a", "--archive", metavar="FILE",
+        help="Pack the minified brushes into a single indexed archive, "
+             "instead of minifying the brush files in place",
+    )
+    parser.add_argument(
+        "--benchmark", action="store_true",
+        help="Compare loading the brushes from the archive with loading "
+             "the individual files (requires --archive)",
+    )
+    parser.add_argument(
+        "--aggressive", action="store_true",
+        help="Also shorten setting values and remove no-op input mappings, "
+             "verifying that the brushes still evaluate identically "
+             "(batch and archive modes only)",
+    )
+    parser.add_argument(
+        "--report", metavar="FILE",
+        help="Write the verification results of --aggressive as json",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="Number of processes used in batch and archive modes "
+             "(default: one per core)",
+    )
+    args = parser.parse_args()
+    if args.benchmark and not args.archive:
+        parser.error("--benchmark requires --archive")
+    if args.aggressive and not (args.batch or args.archive):
+        parser.error("--aggressive requires --batch or --archive")
+    if args.report and not args.aggressive:
+        parser.error("--report requires --aggressive")
+    if args.archive:
+        archive_files(
+            args.settings_file, args.brush_files, args.archive, args.jobs,
+            args.aggressive, args.report)
+        if args.benchmark:
+            benchmark(args.archive, args.brush_files)
+        return 0
+    if args.batch:
+        return batch_strip_files(
+            args.settings_file, args.brush_files, args.jobs,
+            args.aggressive, args.report)
+    return strip_files(args.settings_file, *args.brush_files)
+
+
 if __name__ == "__main__":
     # First argument should be the location of the file brushsettings.json
     # Subsequent arguments should be .myb files (json data) to be minified.
-    exit(strip_files(sys.argv[1], *(sys.argv[2:])))
+    exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+# Precompiles the python modules of the bundle.
+#
+# The appimage is mounted as a read-only squashfs, so the interpreter
+# cannot write bytecode caches, and every module imported at startup
+# is compiled from source on every launch unless the bytecode is bundled.
+# Modules of the standard library that are never imported are removed
+# from the bundle beforehand (see the "unimported" lists), so everything
+# left there is compiled. Third party packages (site-packages) are not
+# pruned, so only the modules of those that are imported are compiled.
+#
+# Subcommands:
+#
+#   trace APPDIR TRACEFILE [MODULE...]
+#     Record the modules the bundled interpreter imports when importing
+#     the given modules (using import-tracer.py).
+#   compile [--used TRACEFILE] DIR...
+#     Compile the modules under the given directories to .pyc files,
+#     placed next to the sources. Modules in site-packages are only
+#     compiled if they were imported in TRACEFILE. Modules that cannot
+#     be compiled are reported and skipped.
+#   zip LIBDIR ZIPFILE
+#     Compile the standard library modules in LIBDIR into ZIPFILE,
+#     which python 2 puts on sys.path by default (lib/python27.zip),
+#     removing the sources. Extension modules and site-packages are
+#     left in place, as is the os module (the prefix landmark).
+#   prune LIBDIR ZIPFILE LISTFILE
+#     Remove the modules in LISTFILE (paths relative to LIBDIR), their
+#     bytecode and their entries in ZIPFILE (if it exists).
+#   measure APPDIR [MODULE...]
+#     Print the size of APPDIR and the time it takes the bundled
+#     interpreter to import the given modules, without writing bytecode.
+#
+# Must be run with the same python version as the one being bundled.
+
+import json
+import os
+import py_compile
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from os.path import join, relpath, getmtime
+
+# Not moved into the zip file
+ZIP_EXCLUDE_DIRS = {"site-packages", "lib-dynload"}
+ZIP_EXCLUDE_FILES = {"os.py"}
+
+USAGE = """\
+Usage: bytecode-bundle.py trace APPDIR TRACEFILE [MODULE...]
+       bytecode-bundle.py compile [--used TRACEFILE] DIR...
+       bytecode-bundle.py zip LIBDIR ZIPFILE
+       bytecode-bundle.py prune LIBDIR ZIPFILE LISTFILE
+       bytecode-bundle.py measure APPDIR [MODULE...]"""
+
+MEASURE_MODULES = ["gi", "numpy", "lib.mypaintlib", "lib.document"]
+MEASURE_RUNS = 5
+SITE_PACKAGES = "site-packages"
+
+
+def traced_files(trace_path):
+    """Real paths of the sources of the modules imported in a trace"""
+    if not os.path.exists(trace_path):
+        print("No import trace (%s), not compiling %s"
+              % (trace_path, SITE_PACKAGES))
+        return set()
+    with open(trace_path) as f:
+        modules = json.load(f)["modules"]
+    used = set()
+    for path in modules.values():
+        if not path:
+            continue
+        base, ext = os.path.splitext(path)
+        if ext in (".pyc", ".pyo"):
+            path = base + ".py"
+        used.add(os.path.realpath(path))
+    return used
+
+
+def module_sources(d, used):
+    for root, dirs, files in os.walk(d):
+        in_site = SITE_PACKAGES in relpath(root, d).split(os.sep)
+        for f in sorted(files):
+            if not f.endswith(".py"):
+                continue
+            path = join(root, f)
+            if in_site and os.path.realpath(path) not in used:
+                continue
+            yield path
+
+
+def compile_dirs(dirs, used):
+    ok = True
+    count = 0
+    for d in dirs:
+        for src in module_sources(d, used):
+            try:
+                py_compile.compile(src, doraise=True)
+                count += 1
+            except py_compile.PyCompileError as e:
+                print("Not compiled: %s" % e.msg)
+                ok = False
+    print("Compiled %d modules" % count)
+    return ok
+
+
+def stdlib_sources(libdir):
+    for root, dirs, files in os.walk(libdir):
+        if root == libdir:
+            dirs[:] = [d for d in dirs if d not in ZIP_EXCLUDE_DIRS]
+        for f in files:
+            if not f.endswith(".py"):
+                continue
+            if root == libdir and f in ZIP_EXCLUDE_FILES:
+                continue
+            yield join(root, f)
+
+
+def zip_stdlib(libdir, zip_path):
+    """Compile the stdlib into zip_path and remove the sources"""
+    tmpdir = tempfile.mkdtemp()
+    cfile = join(tmpdir, "module.pyc")
+    sources = []
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for src in sorted(stdlib_sources(libdir)):
+            name = relpath(src, libdir)
+            try:
+                py_compile.compile(src, cfile, dfile=name, doraise=True)
+            except py_compile.PyCompileError as e:
+                # Left in place, as source
+                print("Not compiled: %s" % e.msg)
+                continue
+            sources.append(src)
+            # Without the source in the zip, zipimport does not check
+            # whether the bytecode is up to date, but keep the timestamp.
+            info = zipfile.ZipInfo(
+                name + "c", time.localtime(getmtime(src))[:6]
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(cfile, "rb") as f:
+                zf.writestr(info, f.read())
+    os.remove(cfile)
+    os.rmdir(tmpdir)
+    for src in sources:
+        for path in (src, src + "c", src + "o"):
+            if os.path.exists(path):
+                os.remove(path)
+    print("Compiled %d modules into %s" % (len(sources), zip_path))
+
+
+def prune(libdir, zip_path, list_path):
+    with open(list_path) as f:
+        names = [os.path.normpath(l.strip()) for l in f if l.strip()]
+    for name in names:
+        for path in (name, name + "c", name + "o"):
+            path = join(libdir, path)
+            if os.path.exists(path):
+                os.remove(path)
+    if not os.path.exists(zip_path):
+        return
+    # Zip files cannot have entries removed in place
+    remove = {n + "c" for n in names}
+    tmp_path = zip_path + ".tmp"
+    with zipfile.ZipFile(zip_path) as src:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename not in remove:
+                    dst.writestr(info, src.read(info))
+    os.rename(tmp_path, zip_path)
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total += os.lstat(join(root, f)).st_size
+    return total
+
+
+def bundle_env(appdir):
+    """Environment running the bundled interpreter without writing bytecode"""
+    usr = join(appdir, "usr")
+    env = dict(os.environ)
+    env.update({
+        "PYTHONHOME": usr,
+        "PYTHONPATH": join(usr, "lib", "mypaint"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "LD_LIBRARY_PATH": join(usr, "lib"),
+    })
+    return env
+
+
+def trace(appdir, trace_path, modules):
+    tracer = join(os.path.dirname(os.path.abspath(__file__)),
+                  "import-tracer.py")
+    # The script's directory is put first on sys.path, so keep it private
+    tmpdir = tempfile.mkdtemp()
+    script = join(tmpdir, "imports.py")
+    with open(script, "w") as f:
+        f.write("import " + ", ".join(modules) + "\n")
+    try:
+        subprocess.check_call(
+            [join(appdir, "usr", "bin", "python"), tracer, "trace",
+             trace_path, script],
+            env=bundle_env(appdir))
+    finally:
+        os.remove(script)
+        os.rmdir(tmpdir)
+
+
+def measure(appdir, modules):
+    env = bundle_env(appdir)
+    cmd = [join(appdir, "usr", "bin", "python"), "-c",
+           "import " + ", ".join(modules)]
+    best = None
+    for _ in range(MEASURE_RUNS):
+        t = time.time()
+        subprocess.check_call(cmd, env=env)
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+    print("Bundle size: %.1f MiB" % (dir_size(appdir) / 1048576.0))
+    print("Startup (import %s): %.0f ms" % (", ".join(modules), best * 1000))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(USAGE)
+        return 1
+    cmd, args = sys.argv[1], sys.argv[2:]
+    if cmd == "trace":
+        trace(args[0], args[1], args[2:] or MEASURE_MODULES)
+    elif cmd == "compile":
+        used = set()
+        if args[:1] == ["--used"]:
+            used = traced_files(args[1])
+            args = args[2:]
+        return 0 if compile_dirs(args, used) else 1
+    elif cmd == "zip":
+        zip_stdlib(*args)
+    elif cmd == "prune":
+        prune(*args)
+    elif cmd == "measure":
+        measure(args[0], args[1:] or MEASURE_MODULES)
+    else:
+        print(USAGE)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -79,6 +79,17 @@ copy_deps2()
   rm -f DEPSFILE
 }
 
+# Copy the library dependencies of all executable files in the current directory,
+# in a single parallel pass that replaces repeated runs of copy_deps2 and also
+# skips the libraries in the excludelist (see resolve-deps.py for details).
+# The dependency graph is written to $APPROOT/deps-graph.json
+resolve_deps()
+{
+  python "$APPIM_SOURCES/scripts/helpers/resolve-deps.py" . "$APPDIR/../excludelist" \
+         --cache "${DEPS_CACHE:-$APPIM_SOURCES/.cache/deps.json}" \
+         --graph "$APPROOT/deps-graph.json"
+}
+
 # Move ./lib/ tree to ./usr/lib/
 move_lib()
 {
@@ -87,14 +98,28 @@ move_lib()
 }
 
 # Delete blacklisted libraries
+# All excludelist rules are combined into a single find expression, so the
+# tree is only walked once, and the rule that matched is logged for each file.
 delete_blacklisted2()
 {
+    local rules=() expr=() line f name rule
     while IFS= read -r line; do
-        FLIST=$(find . -name "${line}*")
-        for F in $FLIST; do
-          rm -v -f "$F"
-        done
+        rules+=("$line")
+        expr+=(-o -name "${line}*")
     done < <(cat "$APPDIR/../excludelist" | sed '/^\s*$/d' | sed '/^#.*$/d')
+    [ ${#rules[@]} -gt 0 ] || return 0
+
+    while IFS= read -r -d '' f; do
+        name=${f##*/}
+        for rule in "${rules[@]}"; do
+            # Unquoted, to match the same way as find -name
+            if [[ $name == $rule* ]]; then
+                echo "excludelist rule \"$rule\" removes $f"
+                break
+            fi
+        done
+        rm -f "$f"
+    done < <(find . ! -type d \( "${expr[@]:1}" \) -print0)
 }
 
 
@@ -105,12 +130,35 @@ glibc_needed()
 }
 
 
-# Remove debugging symbols from bundled executables and libraries
+# Strip a single binary, unless it has no symbol table (already stripped),
+# or a stripped version of the same content is in the cache directory.
+strip_binary()
+{
+  local file="$1" cache="$2" hash
+  hash=$(sha256sum "$file" | cut -d ' ' -f 1)
+  if [ -e "$cache/$hash" ]; then
+    echo "strip (cached) $file"
+    cp "$cache/$hash" "$file"
+  elif readelf -S "$file" 2>/dev/null | grep -q '\.symtab'; then
+    echo "strip $file"
+    strip "$file" &&
+      cp "$file" "$cache/$hash.$$" && mv "$cache/$hash.$$" "$cache/$hash"
+  fi
+}
+export -f strip_binary
+
+# Remove debugging symbols from bundled executables and libraries,
+# running one job per core. Stripped files are cached by the hash of
+# their original content, in $STRIP_CACHE (default: .cache/strip in
+# the sources dir), so unchanged libraries are not stripped again.
 strip_binaries()
 {
+  local cache="${STRIP_CACHE:-$APPIM_SOURCES/.cache/strip}"
   chmod u+w -R "$APPDIR"
+  mkdir -p "$cache"
   find "$APPDIR" -type f -regex '.*\.so\(\.[0-9.]+\)?$' -print0 |
-      xargs -0 --no-run-if-empty --verbose -n1 strip
+      STRIP_CACHE_DIR="$cache" xargs -0 --no-run-if-empty -n1 -P "$(nproc)" \
+                      bash -c 'strip_binary "$1" "$STRIP_CACHE_DIR"' _
 }
 
 
@@ -178,6 +226,62 @@ generate_type2_appimage()
   mv *.AppImage* ../out/
 }
 
+# Echo the path of a tool bundled with appimagetool (e.g. zsyncmake),
+# preferring the one in PATH. Requires generate_type2_appimage to have run.
+appimagekit_tool()
+{
+  local dir f
+  if command -v "$1" &>/dev/null; then
+    command -v "$1"
+    return 0
+  fi
+  dir=$(dirname "$appimagetool")
+  for f in "$dir/usr/bin/$1" "$dir/usr/lib/appimagekit/$1"; do
+    [ -x "$f" ] && echo "$f" && return 0
+  done
+  return 1
+}
+
+# Echo a local path of the given previous AppImage (a path or a url),
+# downloading it if needed.
+previous_appimage()
+{
+  local dest
+  if [[ $1 == *://* ]]; then
+    dest="$APPROOT/previous-$(basename "$1")"
+    [ -e "$dest" ] || wget -q "$1" -O "$dest" || { rm -f "$dest"; return 1; }
+    echo "$dest"
+  else
+    echo "$1"
+  fi
+}
+
+# Generate the .zsync file for a delta update of the given AppImage, and,
+# if a previous build of it is given (a path or a url), report how many of
+# its blocks a zsync client can reuse from the previous build.
+# Missing zsyncmake is an error; the (informational) report never fails.
+zsync_artifacts()
+{
+  local file="$1" previous zsyncmake
+  if ! zsyncmake=$(appimagekit_tool zsyncmake); then
+    echo "zsyncmake not found (not in PATH, nor next to an extracted" \
+         "appimagetool), cannot generate ${file}.zsync" >&2
+    return 1
+  fi
+  "$zsyncmake" -u "$(basename "$file")" -o "${file}.zsync" "$file" || return 1
+  [ -n "$2" ] || return 0
+
+  if ! previous=$(previous_appimage "$2"); then
+    echo "Could not download the previous AppImage: $2"
+    return 0
+  fi
+  if ! python "$APPIM_SOURCES/scripts/helpers/zsync-reuse.py" compare \
+       "$file" "$previous" --zsync "${file}.zsync"; then
+    echo "Could not compare ${file} with the previous AppImage"
+  fi
+  return 0
+}
+
 # Find the desktop file and copy it to the AppDir
 get_desktop()
 {
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# Checks the incremental settings parser of gtk-theme-helper.py against
+# the json module, with the file split at every offset (so that every
+# number, string and literal is cut at a read boundary at some point),
+# and read in chunks of every small size.
+#
+# Usage: gtk-theme-helper-check.py
+#
+# Exits with a non-zero status if any lookup differs.
+
+from __future__ import print_function
+
+import io
+import json
+import os
+import sys
+
+KEY = u"ui.dark_theme_variant"
+
+# Values preceding the key, of every json type, with numbers in all
+# forms and strings with escapes and multi-byte characters
+VALUES = [
+    12.5, -3e-7, 0, 1234567, -0.25, 1.5e+300, 10,
+    u"plain", u"esc\\aped \"quotes\" \u00e9 \u2603 \U0001f58c", u"",
+    True, False, None, [1, 2.75, [u"x"]], {u"a": {u"b": -1e10}},
+]
+
+SMALL_CHUNK_SIZES = range(1, 17)
+
+
+def load_helper():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "gtk-theme-helper.py")
+    namespace = {"__name__": "gtk_theme_helper"}
+    with open(path) as f:
+        exec(compile(f.read(), path, "exec"), namespace)
+    return namespace
+
+
+class SplitFile(io.BytesIO):
+    """A file that never returns data across the given offset in one read"""
+
+    def __init__(self, data, split):
+        io.BytesIO.__init__(self, data)
+        self.split = split
+
+    def read(self, size=-1):
+        pos = self.tell()
+        if pos < self.split and (size < 0 or pos + size > self.split):
+            size = self.split - pos
+        return io.BytesIO.read(self, size)
+
+
+def documents():
+    for value in VALUES:
+        for dark in (True, False):
+            for spacing in ((u", ", u": "), (u",", u":"), (u" ,\n ", u" : ")):
+                sep, colon = spacing
+                yield (
+                    u"{" + u'"before"' + colon + json.dumps(value) + sep +
+                    json.dumps(KEY) + colon + json.dumps(dark) + sep +
+                    u'"after"' + colon + json.dumps(value) + u"}"
+                ).encode("utf-8")
+        # Key not present
+        yield (u'{"before": ' + json.dumps(value) + u"}").encode("utf-8")
+
+
+def main():
+    find_key = load_helper()["find_key"]
+    checks = failures = 0
+    for doc in documents():
+        expected = json.loads(doc.decode("utf-8")).get(KEY, u"default")
+        reads = [(SplitFile(doc, split), None) for split in range(len(doc))]
+        reads += [(io.BytesIO(doc), size) for size in SMALL_CHUNK_SIZES]
+        for fp, size in reads:
+            checks += 1
+            try:
+                if size is None:
+                    result = find_key(fp, KEY, u"default")
+                else:
+                    result = find_key(fp, KEY, u"default", chunk_size=size)
+            except ValueError as e:
+                result = e
+            if result != expected:
+                failures += 1
+                print("%r (split %s, chunk size %s): %r, expected %r" % (
+                    doc, getattr(fp, "split", None), size, result, expected))
+    print("%d checks, %d failures" % (checks, failures))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
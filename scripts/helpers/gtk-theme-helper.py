@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
+import codecs
 import json
-from os.path import join, isfile
+import os
+import re
+from os.path import join, isfile, expanduser
 from argparse import ArgumentParser
-from lib.glib import get_user_config_dir
 
 # When run as a program, returns 0 if the user configuration
 # has the dark theme setting turned on, otherwise returns 1
@@ -11,6 +13,138 @@ from lib.glib import get_user_config_dir
 # Replicates the config directory behaviour of mypaint - handling
 # the -c flag if provided.
 
+DARK_THEME_KEY = u"ui.dark_theme_variant"
+
+# Size of the first read from the settings file
+CHUNK_SIZE = 64 * 1024
+
+# When a value does not fit in the text read so far, it has to be parsed
+# again after reading more. Reading this many times the unparsed text
+# bounds the time wasted on partial parses to a fraction of the total.
+READ_GROWTH = 8
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Characters that can follow a value inside an object or an array
+_VALUE_END = (u",", u"}", u"]", u":")
+
+
+def get_user_config_dir():
+    """
+    Same as GLib.get_user_config_dir, without loading GLib
+    """
+    config_home = os.environ.get("XDG_CONFIG_HOME")
+    return config_home or join(expanduser("~"), ".config")
+
+
+class IncrementalReader(object):
+    """
+    Reads a utf-8 file on demand, discarding the text that has
+    already been parsed.
+
+    Under python 2 the json decoder parses utf-8 encoded str objects
+    directly, so the data is only decoded under python 3.
+    """
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        if bytes is str:
+            self.decode = lambda data, final: data
+            self.text = b""
+        else:
+            self.decode = codecs.getincrementaldecoder("utf-8")().decode
+            self.text = u""
+        self.eof = False
+
+    def parse(self, parse_func, pos):
+        """
+        Run parse_func(text, pos) -> (result, end), reading more of
+        the file when the text is insufficient to parse the token.
+        Returns the result and the end position of the token.
+        """
+        while True:
+            try:
+                result, end = parse_func(self.text, pos)
+                # A token at the very end may be truncated (e.g. numbers)
+                if end < len(self.text) or self.eof:
+                    return result, end
+            except ValueError:
+                if self.eof:
+                    raise
+            pos = self.read_more(pos)
+
+    def read_more(self, pos):
+        """
+        Drop the text preceding pos and read the next chunk of the file,
+        returning the new position of the text that was at pos
+        """
+        size = max(self.chunk_size, READ_GROWTH * (len(self.text) - pos))
+        data = self.fp.read(size)
+        self.eof = not data
+        self.text = self.text[pos:] + self.decode(data, self.eof)
+        return 0
+
+
+def _token(token):
+    def parse(text, pos):
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] != token:
+            raise ValueError("Expected %r at position %d" % (token, pos))
+        return token, pos + 1
+    return parse
+
+
+def _one_of(*tokens):
+    def parse(text, pos):
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] not in tokens:
+            raise ValueError("Expected one of %r at position %d" % (
+                tokens, pos))
+        return text[pos], pos + 1
+    return parse
+
+
+def _value(decoder):
+    def parse(text, pos):
+        result, end = decoder.raw_decode(
+            text, _WHITESPACE.match(text, pos).end())
+        # A value cut at the end of the text read so far can still parse,
+        # as a different value (e.g. "12." as 12), so it is only complete
+        # when followed by a character that can end it.
+        follow = _WHITESPACE.match(text, end).end()
+        if text[follow:follow + 1] not in _VALUE_END:
+            raise ValueError("Incomplete value at position %d" % pos)
+        return result, end
+    return parse
+
+
+def find_key(fp, key, default=None, chunk_size=CHUNK_SIZE):
+    """
+    Look up a single key of the top level json object in the file.
+    Members are parsed one at a time, and parsing stops as soon as the
+    key is found (the rest of the file is never read) or the top level
+    object ends. Returns default if the key is not present.
+    """
+    reader = IncrementalReader(fp, chunk_size)
+    value = _value(json.JSONDecoder())
+    _, pos = reader.parse(_token(u"{"), 0)
+    first, end = reader.parse(_one_of(u"}", u'"'), pos)
+    if first == u"}":
+        return default
+    pos = end - 1
+    colon = _token(u":")
+    separator = _one_of(u",", u"}")
+    while True:
+        name, pos = reader.parse(value, pos)
+        _, pos = reader.parse(colon, pos)
+        result, pos = reader.parse(value, pos)
+        if name == key:
+            return result
+        sep, pos = reader.parse(separator, pos)
+        if sep == u"}":
+            return default
+
 
 def main():
     """
@@ -25,17 +159,16 @@ def main():
     args, _ = parser.parse_known_args()
 
     if args.config is None:
-        confdir = join(get_user_config_dir(), u"mypaint")
+        confdir = join(get_user_config_dir(), "mypaint")
     else:
         confdir = args.config
 
-    settings_path = join(confdir, u"settings.json")
+    settings_path = join(confdir, "settings.json")
 
     if isfile(settings_path):
         try:
             with open(settings_path, "rb") as fp:
-                settings = json.loads(fp.read().decode("utf-8"))
-                dark_theme = settings.get("ui.dark_theme_variant", True)
+                dark_theme = find_key(fp, DARK_THEME_KEY, True)
                 if not dark_theme:
                     # Dark theme has been disabled by the user
                     return 1
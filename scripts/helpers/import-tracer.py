@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+# Determines which python modules and extension libraries of the bundle
+# are used, and generates the prune lists from that.
+#
+# Usage:
+#
+#   import-tracer.py trace TRACEFILE SCRIPT [ARGS...]
+#
+#     Run SCRIPT as __main__ (e.g. the mypaint startup script, or a script
+#     exercising some part of its functionality), recording every module
+#     that gets imported and every shared object that gets loaded.
+#     Must be run with the bundled interpreter. To cover all functionality,
+#     run several workloads, each writing its own trace file.
+#
+#   import-tracer.py lists LIBDIR OUTDIR TRACEFILE...
+#
+#     Combine the trace files and write the standard library modules under
+#     LIBDIR (the bundled lib/python2.7, excluding site-packages, which
+#     the lists are not meant to prune) that none of the workloads used to:
+#       unimported - .py files and whole directories (packages, config,
+#                    test...), except encodings
+#       unimported-encodings - encodings (only removed when translations
+#                              are not bundled)
+#       unimported-dynload - extension modules in lib-dynload
+#     followed by a report of the bytes saved by each of them.
+#     The site-packages modules that are removed are listed by hand, in
+#     unimported-site-packages.
+#
+# The tracer only imports os and sys (already loaded at interpreter
+# startup) before the workload has finished, so that its own imports
+# are not mistaken for those of the workload.
+
+import os
+import sys
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+ENCODINGS_DIR = "encodings"
+DYNLOAD_DIR = "lib-dynload"
+SITE_PACKAGES_DIR = "site-packages"
+SOURCE_SUFFIXES = (".pyc", ".pyo")
+
+
+class ImportTracer(object):
+    """
+    Records the names and files of all modules, as they are imported
+    (modules may be removed from sys.modules again)
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.orig_import = builtins.__import__
+        self.record()
+
+    def install(self):
+        builtins.__import__ = self.traced_import
+
+    def uninstall(self):
+        builtins.__import__ = self.orig_import
+
+    def traced_import(self, *args, **kwargs):
+        num_modules = len(sys.modules)
+        try:
+            return self.orig_import(*args, **kwargs)
+        finally:
+            if len(sys.modules) != num_modules:
+                self.record()
+
+    def record(self):
+        for name, module in list(sys.modules.items()):
+            if module is not None and name not in self.modules:
+                self.modules[name] = getattr(module, "__file__", None)
+
+
+def loaded_shared_objects():
+    """Paths of all shared objects mapped into this process"""
+    paths = set()
+    try:
+        with open("/proc/self/maps") as maps:
+            for line in maps:
+                fields = line.split(None, 5)
+                if len(fields) == 6 and ".so" in fields[5]:
+                    paths.add(fields[5].strip())
+    except IOError:
+        pass
+    return sorted(paths)
+
+
+def trace(trace_path, script, *args):
+    tracer = ImportTracer()
+    sys.argv = [script] + list(args)
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    main_globals = {
+        "__name__": "__main__",
+        "__file__": script,
+        "__builtins__": builtins,
+    }
+    tracer.install()
+    try:
+        with open(script) as f:
+            code = compile(f.read(), script, "exec")
+        exec(code, main_globals)
+    finally:
+        tracer.record()
+        tracer.uninstall()
+        shared_objects = loaded_shared_objects()
+        import json
+        with open(trace_path, "w") as f:
+            json.dump({
+                "workload": sys.argv,
+                "modules": tracer.modules,
+                "shared_objects": shared_objects,
+            }, f, indent=1, sort_keys=True)
+
+
+def source_path(path):
+    """The .py file of a module file, if it is compiled python"""
+    base, ext = os.path.splitext(path)
+    if ext in SOURCE_SUFFIXES:
+        return base + ".py"
+    return path
+
+
+def file_size(path):
+    """
+    Size of a module including its bytecode, if any, or of all files
+    in a directory
+    """
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(path) for f in files
+        )
+    size = 0
+    for p in (path, path + "c", path + "o"):
+        if os.path.exists(p):
+            size += os.path.getsize(p)
+    return size
+
+
+def used_files(traces):
+    used = set()
+    for t in traces:
+        for path in t["modules"].values():
+            if path:
+                used.add(os.path.realpath(source_path(path)))
+        for path in t["shared_objects"]:
+            used.add(os.path.realpath(path))
+    return used
+
+
+def used_dirs(libdir, used):
+    """Directories under libdir containing any of the used files"""
+    libdir = os.path.realpath(libdir)
+    dirs = set()
+    for path in used:
+        path = os.path.dirname(path)
+        while path.startswith(libdir + os.sep) and path not in dirs:
+            dirs.add(path)
+            path = os.path.dirname(path)
+    return dirs
+
+
+def unused_files(libdir, used):
+    """
+    Unused .py files, directories and lib-dynload extensions of the
+    standard library, relative to libdir, grouped by prune list
+    """
+    lists = {"unimported": [], "unimported-encodings": [],
+             "unimported-dynload": []}
+    keep_dirs = used_dirs(libdir, used)
+    for root, dirs, files in os.walk(libdir):
+        rel_root = os.path.relpath(root, libdir)
+        top = rel_root.split(os.sep)[0]
+        for d in sorted(dirs):
+            if root == libdir and d in (
+                    SITE_PACKAGES_DIR, DYNLOAD_DIR, ENCODINGS_DIR):
+                continue
+            if os.path.realpath(os.path.join(root, d)) in keep_dirs:
+                continue
+            # Nothing in it is used, so the whole directory is removed
+            dirs.remove(d)
+            if top != ENCODINGS_DIR:
+                lists["unimported"].append(
+                    "./" + os.path.normpath(os.path.join(rel_root, d)))
+        if root == libdir and SITE_PACKAGES_DIR in dirs:
+            dirs.remove(SITE_PACKAGES_DIR)
+        dirs.sort()
+        for f in sorted(files):
+            path = os.path.join(root, f)
+            if os.path.realpath(path) in used:
+                continue
+            rel = "./" + os.path.normpath(os.path.join(rel_root, f))
+            if top == DYNLOAD_DIR and f.endswith(".so"):
+                lists["unimported-dynload"].append(f)
+            elif top == ENCODINGS_DIR and f.endswith(".py"):
+                lists["unimported-encodings"].append(rel)
+            elif f.endswith(".py"):
+                lists["unimported"].append(rel)
+    for entries in lists.values():
+        entries.sort()
+    return lists
+
+
+def write_lists(libdir, outdir, *trace_paths):
+    import json
+    traces = []
+    for p in trace_paths:
+        with open(p) as f:
+            traces.append(json.load(f))
+    used = used_files(traces)
+    lists = unused_files(libdir, used)
+    sizes = []
+    for name, entries in sorted(lists.items()):
+        with open(os.path.join(outdir, name), "w") as f:
+            for entry in entries:
+                f.write(entry + "\n")
+        for entry in entries:
+            if name == "unimported-dynload":
+                path = os.path.join(libdir, DYNLOAD_DIR, entry)
+            else:
+                path = os.path.join(libdir, entry)
+            sizes.append((file_size(path), entry))
+        print("%s: %d entries" % (name, len(entries)))
+    sizes.sort(reverse=True)
+    for size, entry in sizes:
+        print("%10d  %s" % (size, entry))
+    print("%10d  total bytes saved" % sum(s for s, _ in sizes))
+
+
+def main():
+    cmds = {"trace": (trace, 2), "lists": (write_lists, 3)}
+    if len(sys.argv) < 2 or sys.argv[1] not in cmds:
+        print("Usage: import-tracer.py trace TRACEFILE SCRIPT [ARGS...]")
+        print("       import-tracer.py lists LIBDIR OUTDIR TRACEFILE...")
+        return 1
+    func, min_args = cmds[sys.argv[1]]
+    args = sys.argv[2:]
+    if len(args) < min_args:
+        print("Not enough arguments for " + sys.argv[1])
+        return 1
+    func(*args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
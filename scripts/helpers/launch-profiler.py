@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+# Runs a python script (the mypaint startup script), recording the time
+# spent importing each module and when the gtk main loop first goes idle,
+# and writes the results to a json file.
+#
+# Python 2 has no -X importtime, so the import breakdown is recorded by
+# wrapping __import__ instead. The fields mirror those of -X importtime:
+# the time spent in each module itself and including its nested imports.
+#
+# Usage: launch-profiler.py REPORT_FILE SCRIPT [ARGS...]
+#
+# If MYPAINT_PROFILE_START_US (microseconds since the epoch) is set,
+# the timeline events are relative to that time (the start of the
+# launcher), otherwise they are relative to the start of this script.
+
+import time
+
+START = time.time()
+
+import atexit  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+try:
+    import __builtin__ as builtins
+    from thread import get_ident
+except ImportError:
+    import builtins
+    from _thread import get_ident
+
+# Durations use a monotonic clock where available (python 3); python 2
+# only has the wall clock. The timeline always uses the wall clock, as
+# it is the only clock shared with the launcher script (bash), and it
+# only spans a few seconds, so a clock adjustment during it is unlikely
+# and would show up as an obviously wrong event time.
+timer = getattr(time, "perf_counter", time.time)
+
+# Lower than the gtk redraw priority, so that the first idle call
+# happens after the main window has been drawn.
+IDLE_PRIORITY = 300
+
+# Modules taking less time than this (including nested imports)
+# are left out of the report, to keep its size manageable.
+MIN_CUMULATIVE_US = 100
+
+
+class ImportProfiler(object):
+    """
+    Wraps __import__ to record the import times of the modules loaded
+    by the main thread. The records are stored in the order the imports
+    complete, as (name, self_us, cumulative_us, depth) tuples.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.total = 0.0
+        self.stack = []
+        self.thread = get_ident()
+        self.orig_import = builtins.__import__
+        self.hooks = {}
+
+    def install(self):
+        builtins.__import__ = self.profiled_import
+
+    def uninstall(self):
+        builtins.__import__ = self.orig_import
+
+    def on_import(self, module_name, callback):
+        """Run callback once the given module has been imported"""
+        self.hooks[module_name] = callback
+
+    def profiled_import(self, name, *args, **kwargs):
+        if get_ident() != self.thread:
+            return self.orig_import(name, *args, **kwargs)
+        num_modules = len(sys.modules)
+        # Accumulates the cumulative time of the nested imports
+        self.stack.append(0.0)
+        start = timer()
+        try:
+            return self.orig_import(name, *args, **kwargs)
+        finally:
+            cumulative = timer() - start
+            nested = self.stack.pop()
+            # Nothing was loaded, the module was already imported
+            if len(sys.modules) != num_modules or nested:
+                if self.stack:
+                    self.stack[-1] += cumulative
+                else:
+                    self.total += cumulative
+                cumulative_us = int(cumulative * 1e6)
+                if cumulative_us >= MIN_CUMULATIVE_US:
+                    self.records.append((
+                        resolve_name(name, *args, **kwargs),
+                        int((cumulative - nested) * 1e6),
+                        cumulative_us, len(self.stack),
+                    ))
+                # Modules are only complete when the outermost import is
+                if not self.stack:
+                    self.run_hooks()
+
+    def run_hooks(self):
+        for module_name in list(self.hooks):
+            if module_name in sys.modules:
+                self.hooks.pop(module_name)()
+
+
+def resolve_name(name, globals=None, locals=None, fromlist=(), level=-1):
+    """
+    Full name of an imported module, resolving relative imports
+    (including the implicit relative imports of python 2)
+    """
+    if level == 0 or not globals:
+        return name
+    package = globals.get("__package__")
+    if not package:
+        package = globals.get("__name__", "")
+        if "__path__" not in globals:
+            package = package.rpartition(".")[0]
+    if level > 1:
+        package = package.rsplit(".", level - 1)[0]
+    full_name = package + "." + name if name else package
+    if sys.modules.get(full_name) is not None:
+        return full_name
+    return name
+
+
+class Report(object):
+    """
+    Timeline events and the import breakdown, written as json
+    """
+
+    def __init__(self, path, profiler):
+        self.path = path
+        self.profiler = profiler
+        self.written = False
+        start_us = os.environ.get("MYPAINT_PROFILE_START_US")
+        self.origin = int(start_us) / 1e6 if start_us else START
+        self.events = []
+        self.event("interpreter started", START)
+
+    def event(self, name, t=None):
+        t = time.time() if t is None else t
+        self.events.append({
+            "name": name,
+            "time_ms": round((t - self.origin) * 1000, 3),
+        })
+
+    def write(self):
+        if self.written:
+            return
+        self.written = True
+        imports = [
+            {"module": n, "self_us": s, "cumulative_us": c, "depth": d}
+            for n, s, c, d in self.profiler.records
+        ]
+        report = {
+            "python": sys.version.split()[0],
+            "events": self.events,
+            "imports": imports,
+            "imports_total_us": int(self.profiler.total * 1e6),
+        }
+        with open(self.path, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+def install_idle_probe(report):
+    """
+    Record when the main loop first goes idle - the point at which
+    the application has started up - and write the report then.
+    """
+    from gi.repository import GLib
+
+    def on_idle():
+        report.event("main loop idle")
+        report.profiler.uninstall()
+        report.write()
+        return False
+
+    GLib.idle_add(on_idle, priority=IDLE_PRIORITY)
+
+
+def main():
+    report_path, script = sys.argv[1:3]
+    profiler = ImportProfiler()
+    report = Report(report_path, profiler)
+    profiler.on_import(
+        "gi.repository.GLib", lambda: install_idle_probe(report)
+    )
+    # If the main loop is never reached, the report is written on exit
+    atexit.register(report.write)
+    atexit.register(report.event, "exit")
+
+    sys.argv = sys.argv[2:]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    # Not using runpy, which is not bundled
+    main_globals = {
+        "__name__": "__main__",
+        "__file__": script,
+        "__builtins__": builtins,
+    }
+    with open(script) as f:
+        code = compile(f.read(), script, "exec")
+    profiler.install()
+    exec(code, main_globals)
+
+
+if __name__ == "__main__":
+    main()
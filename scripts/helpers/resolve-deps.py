@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+# Copy the library dependencies of all executables and libraries in an
+# AppDir into its usr/lib directory - a single pass replacement for
+# repeated runs of copy_deps2 and delete_blacklisted2.
+#
+# ldd is run in parallel on every ELF file in the tree, and on every
+# library copied in, until the closure is complete. Dependencies matching
+# the excludelist are neither copied nor scanned. The ldd results are
+# cached, keyed on the location and content hash of each file ($ORIGIN
+# paths depend on both), so unchanged files are not scanned again in later
+# builds. The cache is discarded whenever the library search configuration
+# or the contents of the library search directories change.
+#
+# Symlink chains are copied the way copy_deps2 does it: links to files in
+# the same directory are kept as links, other links are dereferenced.
+
+from __future__ import print_function
+
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from os.path import basename, dirname, join, realpath
+
+ELF_MAGIC = b"\x7fELF"
+LD_CACHE = "/etc/ld.so.cache"
+# Searched (via LD_LIBRARY_PATH) in builds, but not covered by ld.so.cache
+LOCAL_LIB_DIRS = ("/usr/local/lib", "/usr/local/lib64")
+
+
+def read_excludelist(path):
+    """Patterns in the excludelist (comments and empty lines removed)"""
+    with open(path) as f:
+        lines = [l.strip() for l in f]
+    return [l for l in lines if l and not l.startswith("#")]
+
+
+def excluded_by(name, patterns):
+    """The excludelist entry matching the file name, if any"""
+    # Same matching as delete_blacklisted2: find -name "${line}*"
+    for p in patterns:
+        if fnmatch.fnmatchcase(name, p + "*"):
+            return p
+    return None
+
+
+def is_elf(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == ELF_MAGIC
+    except IOError:
+        return False
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def ldd(path):
+    """(name, resolved path or None) pairs for the dependencies of path"""
+    proc = subprocess.Popen(
+        ["ldd", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    out, _ = proc.communicate()
+    deps = []
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and fields[1] == "=>":
+            dep = fields[2] if fields[2].startswith("/") else None
+            deps.append((fields[0], dep))
+    return deps
+
+
+def mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def cache_environment():
+    """Everything besides the scanned files that affects ldd results"""
+    ld_library_path = os.environ.get("LD_LIBRARY_PATH", "")
+    # Directory mtimes change when libraries are added or removed
+    lib_dirs = [d for d in ld_library_path.split(":") if d]
+    lib_dirs += [d for d in LOCAL_LIB_DIRS if d not in lib_dirs]
+    return {
+        "LD_LIBRARY_PATH": ld_library_path,
+        "ld.so.cache": mtime(LD_CACHE),
+        "lib_dirs": [[d, mtime(d)] for d in lib_dirs],
+    }
+
+
+class DepsCache(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.environment = cache_environment()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("environment") == self.environment:
+                self.entries = data["entries"]
+
+    def deps(self, path):
+        key = realpath(path) + ":" + file_hash(path)
+        if key in self.entries:
+            self.hits += 1
+        else:
+            self.entries[key] = ldd(path)
+        return [tuple(d) for d in self.entries[key]]
+
+    def save(self):
+        if not self.path:
+            return
+        cache_dir = dirname(self.path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "environment": self.environment,
+                "entries": self.entries,
+            }, f)
+        os.rename(tmp, self.path)
+
+
+def tree_files(root):
+    """ELF files in the tree, as copy_deps2 would scan them"""
+    files = set()
+    for d, _, names in os.walk(root):
+        for name in names:
+            path = join(d, name)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            lib = name.endswith(".so") or ".so." in name
+            if (lib or os.access(path, os.X_OK)) and is_elf(path):
+                files.add(path)
+    return files
+
+
+def copy_newer(src, dst, follow_symlinks):
+    """Copy a file (or link), unless dst is at least as new (cp -u)"""
+    if os.path.lexists(dst):
+        if os.lstat(dst).st_mtime >= os.lstat(src).st_mtime:
+            return False
+        os.remove(dst)
+    if not follow_symlinks and os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+    else:
+        shutil.copy2(src, dst)
+    return True
+
+
+def copy_library(path, libdir):
+    """
+    Copy a library, along with the symlink chain leading to it.
+    Returns the path of the copied file (the end of the chain).
+    """
+    while os.path.islink(path):
+        target = os.readlink(path)
+        dst = join(libdir, basename(path))
+        if dirname(target):
+            copy_newer(path, dst, follow_symlinks=True)
+        else:
+            copy_newer(path, dst, follow_symlinks=False)
+        if not target.startswith("/"):
+            target = join(dirname(path), target)
+        path = target
+    dst = join(libdir, basename(path))
+    copy_newer(path, dst, follow_symlinks=False)
+    return dst
+
+
+def resolve(appdir, patterns, cache, jobs):
+    appdir = realpath(appdir)
+    libdir = join(appdir, "usr", "lib")
+    if not os.path.isdir(libdir):
+        os.makedirs(libdir)
+
+    graph = {}
+    excluded = {}
+    missing = set()
+    copied = {}
+    scanned = set()
+    pending = tree_files(appdir)
+    pool = ThreadPool(jobs)
+    try:
+        while pending:
+            scanned.update(pending)
+            batch = sorted(pending)
+            pending = set()
+            results = pool.map(cache.deps, batch)
+            for path, deps in zip(batch, results):
+                node = graph.setdefault(os.path.relpath(path, appdir), [])
+                for name, dep in deps:
+                    node.append(name)
+                    rule = excluded_by(name, patterns)
+                    if rule is not None:
+                        excluded[name] = rule
+                        continue
+                    if dep is None or not os.path.exists(dep):
+                        missing.add(name)
+                        continue
+                    if realpath(dep).startswith(appdir + "/"):
+                        continue
+                    if dep in copied:
+                        continue
+                    print("Copying library \"%s\"..." % dep)
+                    copied[dep] = copy_library(dep, libdir)
+                    if copied[dep] not in scanned:
+                        pending.add(copied[dep])
+    finally:
+        pool.close()
+        pool.join()
+    for name in graph:
+        graph[name] = sorted(set(graph[name]))
+    return {
+        "scanned": len(scanned),
+        "copied": sorted(copied),
+        "excluded": excluded,
+        "missing": sorted(missing),
+        "graph": graph,
+    }
+
+
+def main():
+    parser = ArgumentParser(description="Bundle the library dependencies")
+    parser.add_argument("appdir")
+    parser.add_argument("excludelist")
+    parser.add_argument("--cache", help="ldd result cache file")
+    parser.add_argument("--graph", help="Write the dependency graph here")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count())
+    args = parser.parse_args()
+
+    t = time.time()
+    cache = DepsCache(args.cache)
+    patterns = read_excludelist(args.excludelist)
+    report = resolve(args.appdir, patterns, cache, args.jobs)
+    cache.save()
+    if args.graph:
+        with open(args.graph, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+    for name in report["missing"]:
+        print("Warning: dependency not found: " + name)
+    print(
+        "Scanned %d files (%d cached), copied %d libraries, "
+        "excluded %d, in %.1fs" % (
+            report["scanned"], cache.hits, len(report["copied"]),
+            len(report["excluded"]), time.time() - t,
+        ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
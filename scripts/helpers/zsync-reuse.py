@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+# Estimates how much of a new AppImage a zsync client can reuse from the
+# previous version of it, i.e. how much has to be downloaded to update.
+#
+# The new file is split into blocks of the zsync block size, and the old
+# file is searched for each block at every offset, using a rolling
+# checksum (like the zsync client does), confirmed by a strong hash.
+#
+# Subcommands:
+#
+#   compare NEW OLD [--zsync NEW.zsync] [--blocksize N]
+#     Print the fraction of blocks of NEW that are found in OLD. The block
+#     size is taken from the .zsync file of NEW, if given.
+#   variants NEW_APPDIR OLD_APPDIR --mksquashfs PATH [--blocksize N]
+#     Build squashfs images of both AppDirs with a number of compression
+#     and file ordering settings, and print the fraction of reusable blocks
+#     and the image size for each of them.
+#
+# Requires numpy.
+
+from __future__ import print_function
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+# np.isin is not available in the older numpy versions used with python 2
+isin = getattr(np, "isin", None) or np.in1d
+
+# zsyncmake uses 2048 byte blocks for files below 100MB, 4096 otherwise
+DEFAULT_BLOCKSIZE = 4096
+# Amount of a file read and checksummed at a time
+SCAN_CHUNK = 1 << 22
+
+# mksquashfs settings compared by "variants". Each image is built with
+# the options used by appimagetool, followed by those of the variant.
+# "{sortfile}" is replaced by a file placing volatile files last.
+MKSQUASHFS_BASE = ["-root-owned", "-noappend", "-no-progress"]
+VARIANTS = [
+    ("gzip, 128K blocks (appimagetool default)", ["-comp", "gzip"]),
+    ("gzip, 128K blocks, no fragments",
+     ["-comp", "gzip", "-no-fragments"]),
+    ("gzip, 32K blocks", ["-comp", "gzip", "-b", "32768"]),
+    ("gzip, volatile files last",
+     ["-comp", "gzip", "-sort", "{sortfile}"]),
+    ("xz, 128K blocks", ["-comp", "xz"]),
+    ("xz, 1M blocks", ["-comp", "xz", "-b", "1048576"]),
+]
+
+# Path prefixes (relative to the AppDir) of files that change in most
+# builds: MyPaint itself, libmypaint, the brushes and the build info.
+VOLATILE_PATHS = (
+    "usr/lib/mypaint", "usr/share/mypaint", "usr/lib/libmypaint",
+    "usr/share/mypaint-data", "version.txt", "build_source_commits.txt",
+)
+
+
+def read_zsync_header(path):
+    """The header fields of a .zsync file"""
+    fields = {}
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.decode("latin-1").rstrip("\n")
+            if not line:
+                break
+            key, _, value = line.partition(": ")
+            fields[key] = value
+    return fields
+
+
+def weak_sums(data, blocksize):
+    """
+    Rolling checksums (as in rsync/zsync: the sum of the bytes and the
+    sum of those sums, 16 bits each) of every window of data
+    """
+    x = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    idx = np.arange(len(x), dtype=np.int64)
+    c = np.concatenate(([0], np.cumsum(x)))
+    d = np.concatenate(([0], np.cumsum(idx * x)))
+    k = np.arange(len(x) - blocksize + 1, dtype=np.int64)
+    a = c[k + blocksize] - c[k]
+    b = (k + blocksize) * a - (d[k + blocksize] - d[k])
+    return (a & 0xffff) | ((b & 0xffff) << 16)
+
+
+def strong_sum(block):
+    return hashlib.md5(block).digest()
+
+
+def target_blocks(path, blocksize):
+    """
+    The weak and strong checksums of each block of the file, with the
+    last block padded with zeros (as zsync does)
+    """
+    weights = np.arange(blocksize, 0, -1, dtype=np.int64)
+    chunk_size = max(1, SCAN_CHUNK // blocksize) * blocksize
+    weak = []
+    strong = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            data += b"\0" * (-len(data) % blocksize)
+            blocks = np.frombuffer(data, dtype=np.uint8)
+            blocks = blocks.reshape(-1, blocksize)
+            a = blocks.sum(axis=1, dtype=np.int64)
+            b = blocks.dot(weights)
+            weak.append((a & 0xffff) | ((b & 0xffff) << 16))
+            strong.extend(
+                strong_sum(data[i:i + blocksize])
+                for i in range(0, len(data), blocksize)
+            )
+    if not weak:
+        return np.zeros(0, dtype=np.int64), strong
+    return np.concatenate(weak), strong
+
+
+def reusable_fraction(new_path, old_path, blocksize):
+    """(reusable blocks, total blocks) of new_path, found in old_path"""
+    weak, strong = target_blocks(new_path, blocksize)
+    wanted = np.unique(weak)
+    strong_by_weak = {}
+    for w, s in zip(weak.tolist(), strong):
+        strong_by_weak.setdefault(w, set()).add(s)
+
+    found = set()
+    with open(old_path, "rb") as f:
+        tail = b""
+        while True:
+            chunk = f.read(SCAN_CHUNK)
+            data = tail + chunk
+            if len(data) < blocksize:
+                break
+            sums = weak_sums(data, blocksize)
+            for offset in np.nonzero(isin(sums, wanted))[0].tolist():
+                s = strong_sum(data[offset:offset + blocksize])
+                if s in strong_by_weak[int(sums[offset])]:
+                    found.add(s)
+            if not chunk:
+                break
+            tail = data[len(data) - blocksize + 1:]
+    return sum(1 for s in strong if s in found), len(strong)
+
+
+def report_line(label, reused, total, size):
+    fraction = float(reused) / total if total else 0.0
+    return "{label}: {reused}/{total} blocks reusable ({pct:.1f}%), " \
+           "download ~{dl:.1f} of {mb:.1f} MB".format(
+               label=label, reused=reused, total=total, pct=100 * fraction,
+               dl=size * (1 - fraction) / 1e6, mb=size / 1e6)
+
+
+def compare(args):
+    blocksize = args.blocksize
+    if args.zsync:
+        blocksize = int(read_zsync_header(args.zsync)["Blocksize"])
+    t = time.time()
+    reused, total = reusable_fraction(args.new, args.old, blocksize)
+    print(report_line(
+        os.path.basename(args.new), reused, total,
+        os.path.getsize(args.new)))
+    print("(block size {bs}, compared in {t:.1f}s)".format(
+        bs=blocksize, t=time.time() - t))
+    return 0
+
+
+def write_sortfile(appdir, path):
+    """mksquashfs sort file giving volatile files the lowest priority"""
+    with open(path, "w") as f:
+        for prefix in VOLATILE_PATHS:
+            if os.path.exists(os.path.join(appdir, prefix)):
+                f.write("{p} -1\n".format(p=prefix))
+
+
+def build_image(mksquashfs, appdir, image, options, tmpdir):
+    sortfile = os.path.join(tmpdir, "sortfile")
+    write_sortfile(appdir, sortfile)
+    options = [o.replace("{sortfile}", sortfile) for o in options]
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(
+            [mksquashfs, appdir, image] + MKSQUASHFS_BASE + options,
+            stdout=devnull)
+    return os.path.getsize(image)
+
+
+def variants(args):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for label, options in VARIANTS:
+            new = os.path.join(tmpdir, "new.squashfs")
+            old = os.path.join(tmpdir, "old.squashfs")
+            try:
+                size = build_image(
+                    args.mksquashfs, args.new_appdir, new, options, tmpdir)
+                build_image(
+                    args.mksquashfs, args.old_appdir, old, options, tmpdir)
+            except subprocess.CalledProcessError:
+                print("{label}: not supported by mksquashfs".format(
+                    label=label))
+                continue
+            reused, total = reusable_fraction(new, old, args.blocksize)
+            print(report_line(label, reused, total, size))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+def main():
+    parser = ArgumentParser(description="Estimate zsync block reuse")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare a new AppImage with the previous one")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument(
+        "--zsync", help="The .zsync file of the new AppImage")
+    compare_parser.add_argument(
+        "--blocksize", type=int, default=DEFAULT_BLOCKSIZE)
+    compare_parser.set_defaults(func=compare)
+
+    variants_parser = subparsers.add_parser(
+        "variants", help="Compare squashfs settings, using two AppDirs")
+    variants_parser.add_argument("new_appdir")
+    variants_parser.add_argument("old_appdir")
+    variants_parser.add_argument(
+        "--mksquashfs", default="mksquashfs", help="mksquashfs to use")
+    variants_parser.add_argument(
+        "--blocksize", type=int, default=DEFAULT_BLOCKSIZE)
+    variants_parser.set_defaults(func=variants)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
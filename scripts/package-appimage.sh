@@ -70,10 +70,7 @@ echo ""
 echo "Copy dependencies, excluding blacklisted libraries"
 echo ""
 
-copy_deps2; delete_blacklisted2;
-copy_deps2; delete_blacklisted2;
-copy_deps2; delete_blacklisted2;
-copy_deps2; delete_blacklisted2;
+resolve_deps; delete_blacklisted2;
 
 
 # Copy in the dependencies that cannot be assumed to be available
@@ -131,7 +128,8 @@ echo ""
 
 cp -a -t . \
    "$APPIM_SOURCES/AppRun" \
-   "$APPIM_SOURCES/scripts/helpers/gtk-theme-helper.py"
+   "$APPIM_SOURCES/scripts/helpers/gtk-theme-helper.py" \
+   "$APPIM_SOURCES/scripts/helpers/launch-profiler.py"
 get_desktop
 get_icon
 
@@ -196,8 +194,8 @@ echo ""
 echo "Cleaning away miscellaneous unused data"
 echo ""
 
-# Remove .pyc and .pyo files - prioritizing bundle size
-# over a slight increase in load times
+# Remove .pyc and .pyo files - they are compiled later, after the
+# sources are finalized, if bytecode is bundled (see BYTECODE_MODE)
 find "$APPDIR/usr" -name "*.py[co]" -exec rm -f {} +
 
 # Delete the tests directories in the bundled numpy
@@ -308,6 +306,53 @@ minifysvg() {
     done
 )
 
+echo ""
+echo "########################################################################"
+echo ""
+echo "Bundling bytecode, mode: ${BYTECODE_MODE:=none}"
+echo ""
+
+# The appimage is read-only, so without bundled bytecode every module
+# imported by mypaint is compiled from source on every launch.
+# Modes (set via the BYTECODE_MODE environment variable):
+#   none - no bytecode, smallest bundle (default)
+#   imported - .pyc files for all stdlib modules remaining after the
+#              removal of the unimported ones, for mypaint, and for the
+#              site-packages modules imported at startup (traced here)
+#   zip - as imported, but with the standard library compiled into a
+#         zip file on the default sys.path (lib/python27.zip)
+# Bundle size and import time are measured before and after compiling.
+
+bytecode_bundle="$APPIM_SOURCES/scripts/helpers/bytecode-bundle.py"
+pylib="$APPDIR/usr/lib/python2.7"
+pyzip="$APPDIR/usr/lib/python27.zip"
+
+# Wait for the minification, the sources must not change after compiling
+wait
+
+case "$BYTECODE_MODE" in
+    none) ;;
+    imported|zip)
+        echo "Without bytecode:"
+        python "$bytecode_bundle" measure "$APPDIR" || true
+        if [ "$BYTECODE_MODE" = "zip" ]; then
+            python "$bytecode_bundle" zip "$pylib" "$pyzip"
+        fi
+        rm -f "$APPROOT/imports.json"
+        python "$bytecode_bundle" trace "$APPDIR" "$APPROOT/imports.json" ||
+            echo "Could not trace imports, site-packages are not compiled"
+        python "$bytecode_bundle" compile --used "$APPROOT/imports.json" \
+               "$pylib" "$APPDIR/usr/lib/mypaint" ||
+            echo "Some modules could not be compiled, see above"
+        echo "With bytecode ($BYTECODE_MODE):"
+        python "$bytecode_bundle" measure "$APPDIR" || true
+        ;;
+    *)
+        echo "Unknown BYTECODE_MODE: $BYTECODE_MODE"
+        exit 1
+        ;;
+esac
+
 echo ""
 echo "########################################################################"
 echo ""
@@ -381,6 +426,26 @@ sha256sum "${APPIM_FILE_NAME}" > "${APPIM_FILE_NAME}".sha256sum
 
 popd
 
+# Delta update file, and the fraction of it reusable from $PREVIOUS_APPIMAGE
+zsync_artifacts "$APPIM_SOURCES/out/${APPIM_FILE_NAME}" "$PREVIOUS_APPIMAGE"
+
+# Compare how squashfs settings affect that fraction (slow, opt-in)
+if [ x"${ZSYNC_VARIANTS}" = "x1" ] && [ -n "$PREVIOUS_APPIMAGE" ]; then
+    previous_dir=$(mktemp -d)
+    pushd "$previous_dir"
+    if previous=$(previous_appimage "$PREVIOUS_APPIMAGE") &&
+            chmod a+x "$previous" &&
+            "$previous" --appimage-extract >/dev/null; then
+        python "$APPIM_SOURCES/scripts/helpers/zsync-reuse.py" variants \
+               "$APPDIR" "$previous_dir/squashfs-root" \
+               --mksquashfs "$(appimagekit_tool mksquashfs)" || true
+    else
+        echo "Could not extract the previous AppImage, skipping variants"
+    fi
+    popd
+    rm -rf "$previous_dir"
+fi
+
 # Generate AppImage without bundled translations
 find "$APPDIR" -name "*.mo" -exec rm {} +
 rm -rf "$APPDIR/usr/share/locale/"
@@ -390,14 +455,9 @@ supported_locales = []
 
 
 # For the no-translations version, remove all unused encodings
-(
-    cd "$APPDIR"/usr/lib/python2.7
-    pref=$APPIM_SOURCES/scripts/helpers
-    for f in $(cat $pref/"unimported-encodings")
-    do
-        rm -f $f
-    done
-)
+# (along with their bytecode, if bundled)
+python "$bytecode_bundle" prune "$pylib" "$pyzip" \
+       "$APPIM_SOURCES/scripts/helpers/unimported-encodings"
 
 generate_type2_appimage
 
@@ -406,3 +466,7 @@ APPIM_FILE_NAME="${APP}-${VERSION_FULL}-no-translations.AppImage"
 mv ../out/*.AppImage "$APPIM_SOURCES/out/${APPIM_FILE_NAME}"
 pushd "$APPIM_SOURCES/out"
 sha256sum "${APPIM_FILE_NAME}" > "${APPIM_FILE_NAME}".sha256sum
+popd
+
+zsync_artifacts "$APPIM_SOURCES/out/${APPIM_FILE_NAME}" \
+                "$PREVIOUS_APPIMAGE_NO_TRANSLATIONS"
@@ -11,13 +11,22 @@ This code is not quite production-level, so use with caution.
 """
 
 import argparse
+import concurrent.futures
+import datetime
+import email.utils
+import hashlib
 import json
 import os
 import pprint
+import random
 import re
+import shlex
+import sys
+import time
 import uuid
 
 import requests
+import requests.adapters
 import logging
 
 log = logging.getLogger(__file__)
@@ -40,6 +49,98 @@ def default_params(f):
     return wrapper
 
 
+class ProgressReader:
+    """File wrapper reporting the progress of an upload
+
+    The file is read in chunks by the http client, and the callback is
+    called after every chunk with (bytes sent, total bytes, seconds elapsed).
+    The length is exposed so that a Content-Length header is sent.
+    """
+
+    def __init__(self, f, total, callback=None):
+        self.f = f
+        self.total = total
+        self.callback = callback
+        self.sent = 0
+        self.start = time.time()
+        self.end = None
+
+    def __len__(self):
+        return self.total
+
+    def read(self, size=-1):
+        chunk = self.f.read(size)
+        self.sent += len(chunk)
+        if not chunk or self.sent >= self.total:
+            self.end = self.end or time.time()
+        if self.callback:
+            self.callback(self.sent, self.total, time.time() - self.start)
+        return chunk
+
+
+def log_progress(asset_name):
+    """Progress callback logging every 10% of an upload, with the speed"""
+    reported = [0]
+
+    def callback(sent, total, elapsed):
+        percent = 100 * sent // total if total else 100
+        if percent >= reported[0] + 10 or (sent == total and percent != 100):
+            reported[0] = percent - percent % 10
+            log.info("{name}: {percent}% ({speed:.2f} MB/s)".format(
+                name=asset_name, percent=percent,
+                speed=sent / 1e6 / max(elapsed, 1e-6)
+            ))
+    return callback
+
+
+def file_digest(path):
+    """Content digest of a file, computed in chunks
+
+    In the same form as the asset digests provided by the API.
+
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return "sha256:" + h.hexdigest()
+
+
+def asset_digest(asset):
+    """Content digest of a release asset, if it is known
+
+    The digest is computed by GitHub when the asset is uploaded (assets
+    uploaded before digests were introduced do not have one).
+
+    :rtype: str | None
+    """
+    return asset.get('digest')
+
+
+def retry_after_seconds(value):
+    """Delay given by a Retry-After header value
+
+    The value is either a number of seconds or an HTTP date.
+
+    :return: The delay in seconds, or None if the value is invalid
+    :rtype: float | None
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date is None:
+        return None
+    if date.tzinfo is None:  # HTTP dates are always in GMT
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date.timestamp() - time.time()
+
+
 def log_response_error(response):
     log.error("HTTP status code: {code}".format(code=response.status_code))
     decoded = response.content.decode()
@@ -56,42 +157,196 @@ class ReleaseManager:
 
     API_URL_TEMPLATE = "https://api.github.com/repos/{repo_slug}/releases/"
 
+    # Longest wait between retries after errors
+    MAX_BACKOFF = 60
+    # Longest wait for a rate limit to be reset; requests that would need
+    # to wait longer fail instead
+    MAX_RATE_LIMIT_WAIT = 300
+
     def __init__(
-            self, repo_slug, auth_token, timeout=None
+            self, repo_slug, auth_token, timeout=None, workers=4,
+            retries=5, backoff=1.0, progress=None
     ):
+        """
+        :param repo_slug: The 'user/repository' combination of the releases
+        :param auth_token: Github auth token
+        :param timeout: Timeout for network requests, in seconds
+        :param workers: Maximum number of concurrent uploads, also used as
+                        the size of the connection pool
+        :param retries: Number of times a failed request is retried
+        :param backoff: Delay before the first retry, doubled for each retry
+        :param progress: Returns an upload progress callback for the asset
+                         name passed to it (see ProgressReader), optional
+        """
         self.base_url = self.API_URL_TEMPLATE.format(repo_slug=repo_slug)
         self.auth_token = auth_token
         self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.progress = progress
+        # Release data by id and by tag, cleared before and after any
+        # modifying request. The generation is increased at the same time,
+        # so that data fetched while a modifying request runs is not cached.
+        self.release_cache = {}
+        self.cache_generation = 0
+        self.request_count = 0
+        # Connections are kept alive and reused for all requests to a host
+        self.session = requests.Session()
+        self.workers = None
+        self.set_workers(workers)
+
+    def set_workers(self, workers):
+        """Set the maximum number of concurrent uploads
+
+        The connection pool is resized to match, if the number changes.
+        """
+        if workers == self.workers:
+            return
+        self.workers = workers
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     # Helpers
 
     @default_params
     def get(self, *args, **kwargs):
-        return requests.get(*args, **kwargs)
+        return self._request("GET", *args, **kwargs)
 
     @default_params
     def post(self, *args, **kwargs):
-        return requests.post(*args, **kwargs)
+        return self._request("POST", *args, **kwargs)
 
     @default_params
     def patch(self, *args, **kwargs):
-        return requests.patch(*args, **kwargs)
+        return self._request("PATCH", *args, **kwargs)
 
     @default_params
     def delete(self, *args, **kwargs):
-        return requests.delete(*args, **kwargs)
+        return self._request("DELETE", *args, **kwargs)
+
+    def _retry_delay(self, attempt, response=None, idempotent=True):
+        """Seconds to wait before retrying a failed request
+
+        Rate limited requests are retried when the limit is reset, or after
+        the time given by the server, unless that is more than
+        MAX_RATE_LIMIT_WAIT seconds away. Connection errors and server errors
+        are retried with exponential backoff, if the request is idempotent.
+
+        :param attempt: Number of failed attempts so far, minus one
+        :param response: Response of the failed attempt, if any
+        :param idempotent: Whether the request can safely be sent again
+        :return: The delay, or None if the request should not be retried
+        :rtype: float | None
+        """
+        if attempt >= self.retries:
+            return None
+        if response is not None:
+            headers = response.headers
+            rate_limited = response.status_code in (403, 429) and (
+                'Retry-After' in headers or
+                headers.get('X-RateLimit-Remaining') == '0'
+            )
+            if rate_limited:
+                return self._rate_limit_delay(headers)
+            if response.status_code < 500:
+                return None
+        if not idempotent:
+            return None
+        delay = min(self.backoff * 2 ** attempt, self.MAX_BACKOFF)
+        return delay * random.uniform(1.0, 1.5)
+
+    def _rate_limit_delay(self, headers):
+        """Seconds until a rate limit is reset, or None if it is too long
+
+        :rtype: float | None
+        """
+        delay = None
+        if 'Retry-After' in headers:
+            delay = retry_after_seconds(headers['Retry-After'])
+        if delay is None:
+            try:
+                reset = float(headers.get('X-RateLimit-Reset'))
+                delay = reset - time.time()
+            except (TypeError, ValueError):
+                delay = self.MAX_BACKOFF
+        if delay > self.MAX_RATE_LIMIT_WAIT:
+            log.error(
+                "Rate limited for {delay:.0f} seconds, not retrying".format(
+                    delay=delay
+                )
+            )
+            return None
+        return max(delay, 1.0)
+
+    def _request(self, method, url, idempotent=None, retry=True, **kwargs):
+        """Send a request, retrying if it fails
+
+        :param idempotent: Whether the request can be retried after a server
+                           error or a connection failure, where it may have
+                           been processed. Defaults to False only for POST.
+        :param retry: Whether to retry at all (the data may not be reusable)
+        :return: The last response
+        :rtype: requests.Response
+        """
+        if idempotent is None:
+            idempotent = method != "POST"
+        if method == "GET":
+            return self._send(method, url, idempotent, retry, **kwargs)
+        self._invalidate_cache()
+        try:
+            return self._send(method, url, idempotent, retry, **kwargs)
+        finally:
+            self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        self.release_cache.clear()
+        self.cache_generation += 1
+
+    def _send(self, method, url, idempotent, retry, **kwargs):
+        attempt = 0 if retry else self.retries
+        while True:
+            self.request_count += 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self._retry_delay(attempt, idempotent=idempotent)
+                if delay is None:
+                    raise
+                reason = str(e)
+            else:
+                delay = self._retry_delay(attempt, response, idempotent)
+                if delay is None:
+                    return response
+                reason = "HTTP status code {code}".format(
+                    code=response.status_code
+                )
+            log.warning(
+                "{method} {url} failed ({reason}), "
+                "retrying in {delay:.1f} seconds".format(
+                    method=method, url=url, reason=reason, delay=delay
+                )
+            )
+            time.sleep(delay)
+            attempt += 1
 
-    def get_release_data(self, rel_id=None, tag=None, silent=False):
+    def get_release_data(self, rel_id=None, tag=None, silent=False,
+                         use_cache=True):
         """Fetch the release info
         Fetch release info by either id or tag.
         Exactly one of the two must be supplied.
 
+        Fetched data is cached until the next modifying request.
+
         :param rel_id: Fetch release with this id
         :type rel_id: int
         :param tag: Fetch release with this tag
         :type tag: str
         :param silent: Suppress error messages for this function
         :type silent: bool
+        :param use_cache: Return cached data, if any (fetched data is
+                          cached either way)
+        :type use_cache: bool
         :returns: (data dict, http response) if retrieval is successful.
                   (None, http response) if retrieval request is unsuccessful.
         :rtype: (dict | None, requests.Response)
@@ -99,7 +354,11 @@ class ReleaseManager:
         if not ((rel_id is None) ^ (tag is None)):
             msg = "Exactly one of 'rel_id' and 'tag' must be provided!"
             raise ValueError(msg)
+        key = ('id', rel_id) if rel_id else ('tag', tag)
+        if use_cache and key in self.release_cache:
+            return self.release_cache[key]
         url = self.base_url + (str(rel_id) if rel_id else "tags/" + str(tag))
+        generation = self.cache_generation
         response = self.get(url)
         if response.status_code != 200:
             if not silent:
@@ -108,6 +367,8 @@ class ReleaseManager:
             info = None
         else:
             info = json.loads(response.content.decode())
+            if generation == self.cache_generation:
+                self.release_cache[key] = info, response
         return info, response
 
     @staticmethod
@@ -234,62 +495,100 @@ class ReleaseManager:
         return self.delete_release(info['id'])
 
     def _upload_preconditions(self, asset_path, asset_name,
-                              rel_id=None, tag=None, ignore_existing=False):
+                              rel_id=None, tag=None, release_info=None):
         """Check preconditions for asset upload
 
-        :return: (fulfilled, release_info or None)
+        The release data is only fetched if release_info is not given.
+
+        :return: (no asset with the same name exists, release_info),
+                 (False, None) if the file or release cannot be accessed.
         """
         if not os.path.isfile(asset_path):
             log.error("File does not exist: {path}".format(path=asset_path))
             return False, None
 
-        info, _ = self.get_release_data(tag=tag, rel_id=rel_id)
+        info = release_info
+        if not info:
+            info, _ = self.get_release_data(tag=tag, rel_id=rel_id)
         if not info:
             log.error("Release data could not be retrieved, cannot upload.")
             return False, None
 
-        existing = {a['name']: a['id'] for a in info['assets']}
-        if not ignore_existing and asset_name in existing:
-            log.error(
-                "Asset '{name}' already exists, not uploading!".format(
-                    name=asset_name
-                )
-            )
+        existing = {a['name'] for a in info['assets']}
         return asset_name not in existing, info
 
+    @staticmethod
+    def _unchanged(asset_name, digest, release_info):
+        """Check if the release has an asset with the same name and content
+
+        :rtype: bool
+        """
+        return any(
+            asset['name'] == asset_name and asset_digest(asset) == digest
+            for asset in release_info['assets']
+        )
+
+    @staticmethod
+    def _skip_unchanged(asset_name):
+        log.info("Asset '{name}' is unchanged, not uploading".format(
+            name=asset_name
+        ))
+        return True, None
+
     def upload_asset(
             self, asset_path, tag=None, rel_id=None,
-            asset_name=None, asset_label=None
+            asset_name=None, asset_label=None, release_info=None,
+            force=False
     ):
         """Upload a single file as a release asset
 
+        Assets are compared by the content digest provided by the API.
+
         Preconditions:
             The asset_path string must be a valid path to an existing file.
             The release id or release tag ust exist (only one must be given).
-            An asset with the same name cannot exist in the same release.
+            An asset with the same name cannot exist in the same release,
+            unless it has the same content, in which case nothing is uploaded.
 
         :param asset_path: File path to the asset that will be uploaded
         :param tag: Tag of release to upload to (use this or rel_id)
         :param rel_id: Id of release to upload to (use this or tag)
         :param asset_name: Name to use instead of the file name (optional)
         :param asset_label: Label to display in the asset list (optional)
+        :param release_info: Release data, if already fetched (optional)
+        :param force: Do not skip the upload if the content is unchanged
         :return: (True, http response) if asset upload is successful.
                  (False, http response) if asset upload is unsuccessful.
+                 (True, None) if an identical asset already exists.
                  (False, None) if preconditions are not met.
         """
         # Check preconditions
         asset_name = asset_name or os.path.basename(asset_path)
         ok, info = self._upload_preconditions(
-            asset_path, asset_name, tag=tag, rel_id=rel_id
+            asset_path, asset_name, tag=tag, rel_id=rel_id,
+            release_info=release_info
         )
+        if not info:
+            return False, None
         if not ok:
+            if not force and self._unchanged(
+                    asset_name, file_digest(asset_path), info):
+                return self._skip_unchanged(asset_name)
+            log.error(
+                "Asset '{name}' already exists, not uploading!".format(
+                    name=asset_name
+                )
+            )
             return False, None
-        response = self._upload(asset_name, asset_label, asset_path, info)
+        response = self._upload(
+            asset_name, asset_label, asset_path, info
+        )
         if response.status_code == 201:
-            print(
-                json.loads(response.content.decode())['id'],
-                asset_name
-            )
+            # Single write, since uploads can run concurrently
+            print("{id} {name}\n".format(
+                id=json.loads(response.content.decode())['id'],
+                name=asset_name
+            ), end="")
         return response.status_code == 201, response
 
     def edit_asset(self, asset_id, new_name=None, new_label=None):
@@ -319,22 +618,92 @@ class ReleaseManager:
             log.error("Failed to edit asset!")
         return response.status_code == 200, response
 
+    def _delete_partial_asset(self, asset_name, release_info):
+        """Delete what a failed upload attempt may have left behind
+
+        :return: False if an existing asset could not be deleted
+        """
+        # Not cached, the data may predate the failed attempt
+        info, _ = self.get_release_data(
+            rel_id=release_info['id'], use_cache=False
+        )
+        for asset in (info or {}).get('assets', []):
+            if asset['name'] == asset_name:
+                log.info("Deleting partial asset '{name}'".format(
+                    name=asset_name
+                ))
+                return self.delete_asset(asset['id'])[0]
+        return True
+
     def _upload(self, asset_name, asset_label, asset_path, release_info):
+        """Upload a file, streamed in chunks, retrying if the upload fails
+
+        Before an upload is retried, any asset left by the failed attempt is
+        deleted. The throughput and the server response latency (the time
+        between sending the last chunk and receiving the response) are
+        logged for successful uploads.
+
+        :rtype: requests.Response
+        """
         url = release_info['upload_url']
         # Strip away the example parameters in braces
         url = url[:url.rindex('{') - len(url)]
-        url += "?name={name}".format(name=asset_name)
+        params = {'name': asset_name}
         if asset_label:
-            url += "&label={label}".format(label=asset_label)
+            params['label'] = asset_label
         headers = {
             'Accept': 'application/vnd.github.manifold-preview',
             'Content-Type': 'application/octet-stream',
         }
-        with open(asset_path, "rb") as f:
-            response = self.post(
-                url,
-                headers=headers,
-                data=f
+        size = os.path.getsize(asset_path)
+        start = time.time()
+        attempt = 0
+        while True:
+            callback = self.progress and self.progress(asset_name)
+            with open(asset_path, "rb") as f:
+                reader = ProgressReader(f, size, callback)
+                try:
+                    response = self.post(
+                        url,
+                        params=params,
+                        headers=headers,
+                        data=reader,
+                        retry=False
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response, error, reason = None, e, str(e)
+                else:
+                    reason = "HTTP status code {code}".format(
+                        code=response.status_code
+                    )
+            delay = self._retry_delay(attempt, response)
+            if delay is None:
+                break
+            log.warning(
+                "Upload of '{path}' failed ({reason}), "
+                "retrying in {delay:.1f} seconds".format(
+                    path=asset_path, reason=reason, delay=delay
+                )
+            )
+            time.sleep(delay)
+            if not self._delete_partial_asset(asset_name, release_info):
+                break
+            attempt += 1
+        if response is None:
+            # The last attempt could not connect, and was not retried
+            raise error
+        if response.status_code == 201:
+            elapsed = time.time() - start
+            transfer = (reader.end or time.time()) - reader.start
+            log.info(
+                "Uploaded '{name}': {mb:.2f} MB in {elapsed:.1f} s, "
+                "{speed:.2f} MB/s, response latency {latency:.2f} s, "
+                "{attempts} attempt(s)".format(
+                    name=asset_name, mb=size / 1e6, elapsed=elapsed,
+                    speed=size / 1e6 / max(transfer, 1e-6),
+                    latency=time.time() - (reader.end or time.time()),
+                    attempts=attempt + 1
+                )
             )
         if response.status_code != 201:
             log_response_error(response)
@@ -345,13 +714,22 @@ class ReleaseManager:
             )
         return response
 
-    def delete_oldest_assets(self, max_assets, rel_id=None, tag=None):
+    def delete_oldest_assets(self, max_assets, rel_id=None, tag=None,
+                             keep=()):
+        """Delete the oldest assets, such that at most max_assets remain
+
+        :param keep: Names of assets that are never deleted, e.g. ones whose
+                     upload was skipped since they were unchanged (and thus
+                     may be older than the other assets)
+        """
         info, _ = self.get_release_data(rel_id=rel_id, tag=tag)
         assets = sorted(info['assets'], key=lambda a: a['updated_at'])
+        deletable = [a for a in assets if a['name'] not in keep]
         success = True
         acc_responses = []
         if len(assets) > max_assets:
-            for asset in assets[:len(assets) - max_assets]:
+            excess = len(assets) - max_assets
+            for asset in deletable[:excess]:
                 log.info("Deleting asset '{name}'".format(
                     name=asset['name']
                 ))
@@ -376,11 +754,13 @@ class ReleaseManager:
 
     def replace_asset(
             self, asset_path, rel_id=None, tag=None,
-            asset_name=None, asset_label=None
+            asset_name=None, asset_label=None, release_info=None,
+            force=False
     ):
         """Replace any existing asset with the same name
 
         If the asset does not already exist, upload as usual.
+        If the existing asset has the same content, nothing is done.
         The new asset is uploaded first with a random prefix, followed by the
         deletion of the old asset and renaming of the new asset.
         The deletion of the old asset will only happen if the new file is
@@ -393,20 +773,26 @@ class ReleaseManager:
         :param tag: Tag of release to upload to (use this or rel_id)
         :param asset_name: Name to use instead of the file name (optional)
         :param asset_label: Label to display in the asset list (optional)
+        :param release_info: Release data, if already fetched (optional)
+        :param force: Replace the asset even if the content is unchanged
         :return: (True, http response) if asset replacement is successful.
                  (False, http response) if asset replacement is unsuccessful.
+                 (True, None) if an identical asset already exists.
                  (False, None) if preconditions are not met.
         """
         asset_name = asset_name or os.path.basename(asset_path)
         ok, info = self._upload_preconditions(
             asset_path, asset_name, tag=tag, rel_id=rel_id,
-            ignore_existing=True
+            release_info=release_info
         )
+        if not info:
+            return False, None
         if ok:  # Just upload as usual
             response = self._upload(asset_name, asset_label, asset_path, info)
             return response.status_code == 201, response
-        elif not info:
-            return False, None
+        if not force and self._unchanged(
+                asset_name, file_digest(asset_path), info):
+            return self._skip_unchanged(asset_name)
 
         # Replacement required
         tmp_name = uuid.uuid4().hex + '-' + asset_name
@@ -435,6 +821,60 @@ class ReleaseManager:
             log.error(cleanup_error_msg)
         return edited, edit_response
 
+    def upload_assets(self, asset_paths, rel_id=None, tag=None, replace=False,
+                      force=False):
+        """Upload multiple files as release assets, concurrently
+
+        The release data is fetched once, and shared by all uploads.
+        At most self.workers files are uploaded at the same time.
+
+        :param asset_paths: File paths of the assets that will be uploaded
+        :param rel_id: Id of release to upload to (use this or tag)
+        :param tag: Tag of release to upload to (use this or rel_id)
+        :param replace: Replace existing assets with the same names
+        :param force: Upload files even if identical assets exist
+        :return: (True, [result]) if all uploads are successful.
+                 (False, [result]) if any upload is unsuccessful.
+                 (False, None) if the release data cannot be retrieved.
+                 The results are those of upload_asset/replace_asset for
+                 each file, in the same order.
+        """
+        info, _ = self.get_release_data(tag=tag, rel_id=rel_id)
+        if not info:
+            log.error("Release data could not be retrieved, cannot upload.")
+            return False, None
+        upload = self.replace_asset if replace else self.upload_asset
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            results = list(executor.map(
+                lambda path: upload(
+                    asset_path=path, release_info=info, force=force
+                ),
+                asset_paths
+            ))
+        return all(ok for ok, _ in results), results
+
+    def assets_unchanged(self, asset_paths, rel_id=None, tag=None):
+        """Check if the release has identical assets for all the files
+
+        :param asset_paths: Paths of the files, named as the assets
+        :param rel_id: Id of release to check (use this or tag)
+        :param tag: Tag of release to check (use this or rel_id)
+        :return: (True, http response) if all files have identical assets
+                 (False, http response) if any file does not
+                 (False, http response) if the release cannot be accessed
+        """
+        info, response = self.get_release_data(
+            tag=tag, rel_id=rel_id, silent=True
+        )
+        if not info:
+            return False, response
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            digests = list(executor.map(file_digest, asset_paths))
+        return all(
+            self._unchanged(os.path.basename(path), digest, info)
+            for path, digest in zip(asset_paths, digests)
+        ), response
+
 
 # Code below this point is only related to CLI input/verification
 
@@ -488,6 +928,17 @@ def max_assets_value(value):
         )
 
 
+def workers_value(value):
+    try:
+        int_value = int(value)
+        assert int_value > 0
+        return int_value
+    except Exception:
+        raise argparse.ArgumentTypeError(
+            "The number of workers must be a positive integer."
+        )
+
+
 def true_or_false(value):
     if not value.lower() in ['true', 'false']:
         raise argparse.ArgumentTypeError(
@@ -507,17 +958,14 @@ def get_parser():
         '--timeout', metavar="SECONDS", type=float,
         help="Timeout to use for network requests, default is 60 seconds"
     )
-    tag_id_parser = argparse.ArgumentParser(add_help=False)
-    ref_group = tag_id_parser.add_mutually_exclusive_group(required=True)
-    ref_group.add_argument(
-        "-t", "--tag", metavar="TAG_NAME", type=str,
-        help="Identify release by tag"
+    parser.add_argument(
+        '--retries', metavar="RETRIES", type=int, default=5,
+        help="Number of times failed requests are retried, default is 5"
     )
-    ref_group.add_argument(
-        "-i", "--release-id", metavar="RELEASE_ID", type=int,
-        help="Identify release by id"
+    parser.add_argument(
+        '-q', '--quiet', action="store_true",
+        help="Only log warnings and errors (no upload progress)"
     )
-
     auth_group = parser.add_mutually_exclusive_group(required=True)
     auth_group.add_argument(
         "-a", "--auth-token-var", metavar="VAR_NAME",
@@ -534,6 +982,55 @@ def get_parser():
         dest='command'
     )
     subparsers.required = True
+    add_commands(subparsers)
+
+    # Run multiple commands
+    batch_parser = subparsers.add_parser(
+        'batch', help="Run the commands listed in a file, one per line "
+                      "(quoted arguments can span lines), sharing the "
+                      "connections and the fetched release data. "
+                      "'{release_id}' in arguments is replaced by the id of "
+                      "the last release created. Failures of commands "
+                      "prefixed with '-' (e.g. '-delete -t TAG') are ignored."
+    )
+    batch_parser.add_argument(
+        "-k", "--keep-going", action="store_true",
+        help="Run all commands, even if some of them fail. By default, "
+             "the remaining commands are skipped when one fails."
+    )
+    batch_parser.add_argument(
+        "-w", "--workers", metavar="WORKERS", type=workers_value,
+        default=4, help="Maximum number of concurrent uploads, for commands "
+                        "that do not set it themselves (default: 4)"
+    )
+    batch_parser.add_argument(
+        "batch_file", nargs="?", metavar="FILE", default="-",
+        help="File listing the commands, default is stdin"
+    )
+
+    return parser
+
+
+def get_command_parser():
+    """Parser for the commands of a batch file"""
+    parser = argparse.ArgumentParser(prog="batch command", add_help=False)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    add_commands(subparsers)
+    return parser
+
+
+def add_commands(subparsers):
+    tag_id_parser = argparse.ArgumentParser(add_help=False)
+    ref_group = tag_id_parser.add_mutually_exclusive_group(required=True)
+    ref_group.add_argument(
+        "-t", "--tag", metavar="TAG_NAME", type=str,
+        help="Identify release by tag"
+    )
+    ref_group.add_argument(
+        "-i", "--release-id", metavar="RELEASE_ID", type=int,
+        help="Identify release by id"
+    )
 
     # Common options for release creation/modification
     release_options = argparse.ArgumentParser(add_help=False)
@@ -607,11 +1104,33 @@ def get_parser():
         help="If an asset with the same name already exists, replace it. "
               "Otherwise, nothing is uploaded."
     )
+    upload_parser.add_argument(
+        "-f", "--force", action="store_true",
+        help="Upload files even if identical assets (by content digest) "
+             "already exist. Otherwise those uploads are skipped."
+    )
+    upload_parser.add_argument(
+        "-w", "--workers", metavar="WORKERS", type=workers_value,
+        help="Number of files to upload concurrently (default: 4, or the "
+             "number given to the batch command)"
+    )
     upload_parser.add_argument(
         "asset_paths", nargs="+", metavar="FILE", type=file_path_value,
         help="File path of asset that will be added to the release."
     )
 
+    # Check assets
+    unchanged_parser = subparsers.add_parser(
+        'assets-unchanged',
+        help="Exit successfully if the release has identical assets "
+             "(by name and content digest) for all the files",
+        parents=[ref_group]
+    )
+    unchanged_parser.add_argument(
+        "asset_paths", nargs="+", metavar="FILE", type=file_path_value,
+        help="File path of asset to check."
+    )
+
     # Edit asset
     edit_asset_parser = subparsers.add_parser(
         'edit-asset', help="Edit the name/label of an existing asset",
@@ -625,8 +1144,6 @@ def get_parser():
     )
     delete_asset_parser.add_argument('asset_id', metavar="ASSET_ID", type=int)
 
-    return parser
-
 
 def verify_token(args):
     """Basic auth token checks"""
@@ -648,15 +1165,105 @@ def verify_token(args):
     return auth_token
 
 
+def read_batch_commands(batch_file):
+    """Split the batch file into the arguments of each command
+
+    Commands are separated by newlines, except inside quotes.
+
+    :rtype: [[str]]
+    """
+    with (sys.stdin if batch_file == '-' else open(batch_file)) as f:
+        lines = f.read().splitlines(True)
+    commands = []
+    pending = ""
+    for line in lines:
+        pending += line
+        try:
+            args = shlex.split(pending, comments=True)
+        except ValueError:  # Unterminated quote, continue on the next line
+            continue
+        if args:
+            commands.append(args)
+        pending = ""
+    if pending.strip():
+        raise ValueError("Unterminated quote in batch file")
+    return commands
+
+
+def run_batch(rm, args):
+    """Run the commands of a batch file, logging the time taken by each"""
+    parser = get_command_parser()
+    commands = read_batch_commands(args.batch_file)
+    release_id = None
+    success = True
+    acc_responses = []
+    start = time.time()
+    for num, cmd_args in enumerate(commands, 1):
+        if release_id is not None:
+            cmd_args = [
+                a.replace("{release_id}", str(release_id)) for a in cmd_args
+            ]
+        ignore_failure = cmd_args[0].startswith('-')
+        if ignore_failure:
+            cmd_args = [cmd_args[0][1:]] + cmd_args[1:]
+        requests_before = rm.request_count
+        t = time.time()
+        try:
+            result = run_command(
+                rm, parser.parse_args(cmd_args), workers=args.workers
+            )
+        except SystemExit:  # Invalid arguments, reported by the parser
+            result = False, None
+        log.info(
+            "[{num}/{total}] {cmd}: {status} in {time:.2f} s, "
+            "{requests} request(s)".format(
+                num=num, total=len(commands), cmd=cmd_args[0],
+                status="done" if result[0] else (
+                    "failed (ignored)" if ignore_failure else "FAILED"
+                ),
+                time=time.time() - t,
+                requests=rm.request_count - requests_before
+            )
+        )
+        if cmd_args[0] == "create" and result[0]:
+            release_id = json.loads(result[1].content.decode())['id']
+        acc_responses.append(result[1])
+        if ignore_failure:
+            continue
+        success = success and result[0]
+        if not result[0] and not args.keep_going:
+            log.error("Command failed, skipping the remaining commands")
+            break
+    log.info(
+        "Batch finished in {time:.2f} s, {requests} request(s)".format(
+            time=time.time() - start, requests=rm.request_count
+        )
+    )
+    return success, acc_responses
+
+
 def main():
     args = get_parser().parse_args()
     auth_token = verify_token(args)
     rm = ReleaseManager(
             repo_slug=args.repo_slug,
             auth_token=auth_token,
-            timeout=args.timeout or 60
+            timeout=args.timeout or 60,
+            workers=getattr(args, 'workers', None) or 4,
+            retries=args.retries,
+            progress=None if args.quiet else log_progress
     )
+    log.setLevel(logging.WARNING if args.quiet else logging.INFO)
+    if args.command == "batch":
+        return run_batch(rm, args)
+    return run_command(rm, args)
+
+
+def run_command(rm, args, workers=4):
+    """Run a single command with the release manager
 
+    :param workers: Concurrent uploads, unless the command sets it
+    """
     cmd = args.command
     rel_args = None
     if cmd in ['create', 'edit']:
@@ -690,6 +1297,7 @@ def main():
         else:
             result = rm.delete_release_by_tag(args.tag)
     elif cmd == "upload-asset":
+        rm.set_workers(args.workers or workers)
         upload = rm.replace_asset if args.replace else rm.upload_asset
         if len(args.asset_paths) == 1:
             result = upload(
@@ -697,32 +1305,40 @@ def main():
                 tag=args.tag,
                 rel_id=args.release_id,
                 asset_name=args.name,
-                asset_label=args.label)
+                asset_label=args.label,
+                force=args.force)
+            names = [args.name or os.path.basename(args.asset_paths[0])]
+            results = [result]
         else:
             if args.name or args.label:
                 log.warning(
                     "Asset name/label options ignored for multiple files"
                 )
             # Remove any duplicates
-            paths = set(args.asset_paths)
-            success = True
-            acc_responses = []
-            for p in paths:
-                ok, response = upload(
-                    asset_path=p,
-                    tag=args.tag,
-                    rel_id=args.release_id
-                )
-                success = success and ok
-                acc_responses.append(response)
-            result = success, acc_responses
+            paths = sorted(set(args.asset_paths))
+            result = rm.upload_assets(
+                paths, rel_id=args.release_id, tag=args.tag,
+                replace=args.replace, force=args.force
+            )
+            names = [os.path.basename(p) for p in paths]
+            results = result[1] or []
         if args.max_assets:
+            # Skipped (unchanged) assets may be older than the ones deleted
+            skipped = {
+                name for name, (ok, response) in zip(names, results)
+                if ok and response is None
+            }
             success, responses = rm.delete_oldest_assets(
                 max_assets=args.max_assets,
                 rel_id=args.release_id,
-                tag=args.tag
+                tag=args.tag,
+                keep=skipped
             )
             result = result[0] and success, (result[1], responses)
+    elif cmd == "assets-unchanged":
+        result = rm.assets_unchanged(
+            args.asset_paths, rel_id=args.release_id, tag=args.tag
+        )
     elif cmd == "edit-asset":
         result = rm.edit_asset(
             args.asset_id, new_name=args.name, new_label=args.label
@@ -735,4 +1351,5 @@ def main():
 
 
 if __name__ == '__main__':
+    logging.basicConfig(format="%(message)s")
     exit(not main()[0])
@@ -26,32 +26,44 @@ rel()
     $rel_script -a GITHUB_BOT_TOKEN "$TRAVIS_REPO_SLUG" "$@"
 }
 
+# Quote arguments for a release.py batch file (shell-like syntax)
+quote()
+{
+    local arg
+    for arg in "$@"; do
+        printf "'%s' " "${arg//\'/\'\\\'\'}"
+    done
+}
+assets=$(quote "$@")
+
 # == Create new continous release ==
 rel_tag="continuous"
 rel_body="Build log: $TRAVIS_BUILD_WEB_URL"
 rel_name="Continuous release"
-# Create a new draft release
-id=$(
-    rel create $rel_tag -n "$rel_name" -b "$rel_body" --draft=true \
-	--commitish="$TRAVIS_COMMIT" --prerelease=true
-  )
-if [ -n "$id" ]; then
-    # Upload assets to draft release
-    rel upload-asset -i "$id" "$@"
-    # Delete old continuous release
-    rel delete -t "$rel_tag"
-    # Set draft release as new (non-draft) continuous release
-    rel edit -i "$id" --draft=false
+# Assets are compared by content digest, so an unchanged build is not uploaded
+if rel assets-unchanged -t "$rel_tag" "$@"; then
+    echo "Assets of the continuous release are unchanged, not replacing it"
 else
-    echo "Failed to create new continuous release draft!"
+    # Create a new draft release, upload the assets to it, delete the old
+    # continuous release and set the draft release as the new (non-draft)
+    # continuous release. The remaining steps are skipped if a step fails,
+    # except for the deletion (there may be no old release).
+    rel batch <<EOF
+create $rel_tag -n $(quote "$rel_name") -b $(quote "$rel_body") --draft=true --commitish=$(quote "$TRAVIS_COMMIT") --prerelease=true
+upload-asset -i {release_id} $assets
+-delete -t $rel_tag
+edit -i {release_id} --draft=false
+EOF
 fi
 
 # == Upload to rotating release ==
 rel_tag="continuous-rotating"
-# Create if it does not exist
-rel create $rel_tag
 rel_body="Last updated: $(date -R)
 Latest build log: $TRAVIS_BUILD_WEB_URL
 "
-rel edit -t $rel_tag --body="$rel_body" --name "$rel_name - (rotating)"
-rel upload-asset -t $rel_tag --replace --max-assets 10 "$@"
+# Create if it does not exist
+rel batch <<EOF
+-create $rel_tag
+edit -t $rel_tag --body=$(quote "$rel_body") --name $(quote "$rel_name - (rotating)")
+upload-asset -t $rel_tag --replace --max-assets 10 $assets
+EOF